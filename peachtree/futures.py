@@ -1,40 +1,125 @@
 import threading
+import time
 import sys
+import Queue
 
 
-def thread_map(func, iterable):
-    workers = [start_worker(func, (value, )) for value in iterable]
-    return [worker.join() for worker in workers]
+def thread_map(func, iterable, max_workers=None, timeout=None):
+    values = list(iterable)
+    results = [None] * len(values)
+    for index, result in as_completed(func, values, max_workers=max_workers, timeout=timeout):
+        results[index] = result
+    return results
 
 
-def start_worker(func, args):
-    worker = Worker(lambda: func(*args))
-    worker.start()
-    return worker
-    
+def as_completed(func, iterable, max_workers=None, timeout=None):
+    values = list(iterable)
+    if not values:
+        return iter([])
+    if max_workers is None:
+        max_workers = len(values)
+    return _MapExecution(func, values, max_workers, timeout).results()
+
+
+class TaskTimeoutError(RuntimeError):
+    pass
+
 
-class Worker(object):
-    def __init__(self, func):
+class _MapExecution(object):
+    def __init__(self, func, values, max_workers, timeout):
         self._func = func
-        self._error = None
+        self._values = values
+        self._timeout = timeout
+        self._pending = Queue.Queue()
+        self._completed = Queue.Queue()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._start_times = {}
         
-    def start(self):
-        self._thread = threading.Thread(target=self._apply)
-        self._thread.start()
+        for index, value in enumerate(values):
+            self._pending.put((index, value))
+        
+        for worker_index in range(min(max_workers, len(values))):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
     
-    def join(self):
-        self._thread.join()
-        if self._error is None:
-            return self._value
-        else:
-            self._reraise_error()
+    def results(self):
+        error = None
+        for completed_count in range(len(self._values)):
+            completed = self._wait_for_completed()
+            if completed is None:
+                # Once the pending values have been cancelled, only the
+                # values that were already running will complete
+                break
+            
+            index, result, exc_info = completed
+            if exc_info is not None:
+                if error is None:
+                    error = exc_info
+            elif error is None:
+                yield index, result
+        
+        if error is not None:
+            raise error[0], error[1], error[2]
     
-    def _apply(self):
-        try:
-            self._value = self._func()
-        except:
-            self._error = sys.exc_info()
-            raise
+    def _wait_for_completed(self):
+        while True:
+            if self._cancelled.is_set() and not self._start_times:
+                try:
+                    return self._completed.get_nowait()
+                except Queue.Empty:
+                    return None
             
-    def _reraise_error(self):
-        raise self._error[0], self._error[1], self._error[2]
+            try:
+                return self._completed.get(timeout=self._time_until_next_timeout())
+            except Queue.Empty:
+                self._check_timeouts()
+    
+    def _time_until_next_timeout(self):
+        if self._timeout is None:
+            # Use a long timeout rather than none so that KeyboardInterrupt
+            # is still delivered to the waiting thread
+            return 60 * 60
+        with self._lock:
+            start_times = self._start_times.values()
+        if not start_times:
+            return self._timeout
+        return max(0, min(start_times) + self._timeout - time.time())
+    
+    def _check_timeouts(self):
+        if self._timeout is None:
+            return
+        with self._lock:
+            start_times = self._start_times.values()
+        if any(time.time() - start_time >= self._timeout for start_time in start_times):
+            # The running tasks can't be stopped, so leave them to finish
+            # in the background
+            self._cancel()
+            raise TaskTimeoutError("Task did not complete within {0} seconds".format(self._timeout))
+    
+    def _cancel(self):
+        self._cancelled.set()
+    
+    def _work(self):
+        while not self._cancelled.is_set():
+            try:
+                index, value = self._pending.get_nowait()
+            except Queue.Empty:
+                return
+            
+            with self._lock:
+                if self._cancelled.is_set():
+                    return
+                self._start_times[index] = time.time()
+            
+            try:
+                result = self._func(value), None
+            except:
+                result = None, sys.exc_info()
+                self._cancel()
+            
+            with self._lock:
+                del self._start_times[index]
+                self._completed.put((index, ) + result)
+
@@ -0,0 +1,126 @@
+import threading
+import uuid
+import time
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+
+class JobStates(object):
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class Jobs(object):
+    def __init__(self, expiry_time=10 * 60):
+        self._expiry_time = expiry_time
+        self._condition = threading.Condition()
+        self._jobs = {}
+    
+    def start(self, func, on_cancel=None):
+        identifier = str(uuid.uuid4())
+        job = _Job(identifier, on_cancel)
+        with self._condition:
+            self._remove_expired_jobs()
+            self._jobs[identifier] = job
+        
+        thread = threading.Thread(target=self._run, args=(job, func))
+        thread.daemon = True
+        thread.start()
+        return identifier
+    
+    def wait(self, identifier, timeout=0):
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                job = self._jobs.get(identifier, None)
+                if job is None:
+                    return None
+                
+                remaining_time = deadline - time.time()
+                if job.state != JobStates.running or remaining_time <= 0:
+                    return job.describe()
+                
+                self._condition.wait(remaining_time)
+    
+    def cancel(self, identifier):
+        with self._condition:
+            job = self._jobs.get(identifier, None)
+            if job is None:
+                return False
+            if job.cancelled:
+                return True
+            job.cancelled = True
+            has_finished = job.state != JobStates.running
+        
+        # A job that's still running is discarded once it finishes
+        if has_finished:
+            self._discard(job)
+        return True
+    
+    def _run(self, job, func):
+        try:
+            result = func()
+            state, error = JobStates.succeeded, None
+        except Exception as error:
+            _logger.exception("Job {0} failed".format(job.identifier))
+            result = None
+            state, error = JobStates.failed, error
+        
+        with self._condition:
+            job.finish(state, result, error)
+            self._condition.notify_all()
+            was_cancelled = job.cancelled
+        
+        if was_cancelled:
+            self._discard(job)
+    
+    def _discard(self, job):
+        if job.state == JobStates.succeeded and job.on_cancel is not None:
+            try:
+                job.on_cancel(job.result)
+            except Exception:
+                _logger.exception("Failed to discard result of job {0}".format(job.identifier))
+    
+    def _remove_expired_jobs(self):
+        now = time.time()
+        expired = [
+            identifier
+            for identifier, job in self._jobs.iteritems()
+            if job.finish_time is not None and now - job.finish_time > self._expiry_time
+        ]
+        for identifier in expired:
+            del self._jobs[identifier]
+
+
+class _Job(object):
+    def __init__(self, identifier, on_cancel):
+        self.identifier = identifier
+        self.on_cancel = on_cancel
+        self.state = JobStates.running
+        self.cancelled = False
+        self.finish_time = None
+        self.result = None
+        self._error = None
+    
+    def finish(self, state, result, error):
+        self.state = state
+        self.finish_time = time.time()
+        self.result = result
+        self._error = error
+    
+    def describe(self):
+        if self._error is None:
+            error, error_type = None, None
+        else:
+            error = str(self._error) or type(self._error).__name__
+            error_type = type(self._error).__name__
+        return {
+            "jobId": self.identifier,
+            "state": self.state,
+            "result": self.result,
+            "error": error,
+            "errorType": error_type,
+        }
@@ -5,6 +5,11 @@ import spur.ssh
 
 from .sshconfig import SshConfig
 from . import wait
+from . import sshpool
+from . import sshready
+
+
+_restart_timeout = 30
 
 
 class MachineWrapper(object):
@@ -16,8 +21,14 @@ class MachineWrapper(object):
         "external_hostname",
         "is_running",
         "forwarded_tcp_ports",
-        "destroy",
         "users",
+        "output",
+        "follow_output",
+        "pause",
+        "resume",
+        "is_paused",
+        "current_memory_size",
+        "set_memory_size",
     ]
     
     def __init__(self, machine):
@@ -44,7 +55,15 @@ class MachineWrapper(object):
         
     def shell(self, *args, **kwargs):
         config = self.ssh_config(*args, **kwargs)
-        return config.shell()
+        return sshpool.shells.shell(self.identifier, config)
+    
+    def destroy(self):
+        sshpool.shells.evict(self.identifier)
+        self._machine.destroy()
+    
+    def power_down(self):
+        sshpool.shells.evict(self.identifier)
+        self._machine.power_down()
         
     def ssh_config(self, username=None):
         user = self._find_user(username)
@@ -56,14 +75,46 @@ class MachineWrapper(object):
         )
     
     def restart(self):
+        if hasattr(self._machine, "reset"):
+            self._reset()
+        elif hasattr(self._machine, "restart"):
+            self._machine.restart()
+        else:
+            self._reboot()
+        sshpool.shells.evict(self.identifier)
+    
+    def _reset(self):
+        sshpool.shells.evict(self.identifier)
+        self._machine.reset()
+        
+        hostname = self.external_hostname()
+        port = self.public_port(self.ssh_internal_port)
+        wait.wait_until(
+            lambda: sshready.has_ssh_banner(hostname, port),
+            timeout=_restart_timeout, wait_time=0.05, max_wait_time=1,
+            error_message="Failed to restart VM"
+        )
+        
+        def attempt_ssh_command():
+            with self.root_shell() as root_shell:
+                root_shell.run(["true"])
+        
+        wait.wait_until_successful(
+            attempt_ssh_command,
+            errors=(spur.ssh.ConnectionError, ),
+            timeout=_restart_timeout, wait_time=0.1, max_wait_time=1
+        )
+    
+    def _reboot(self):
         tmp_file = os.path.join("/tmp/", str(uuid.uuid4()))
         with self.root_shell() as root_shell:
             root_shell.run(["touch", tmp_file])
             root_shell.spawn(["reboot"])
-            
+        
+        sshpool.shells.evict(self.identifier)
+        
         def has_restarted():
             try:
-                # TODO: automatic reconnection of shell
                 with self.root_shell() as root_shell:
                     result = root_shell.run(
                         ["test", "-f", tmp_file],
@@ -74,7 +125,7 @@ class MachineWrapper(object):
                 return False
             
         wait.wait_until(
-            has_restarted, timeout=30, wait_time=1,
+            has_restarted, timeout=_restart_timeout, wait_time=1,
             error_message="Failed to restart VM"
         )
             
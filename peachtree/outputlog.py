@@ -0,0 +1,137 @@
+# Processes write their output directly to a file opened for appending.
+# Since the file stays open in the process, it's rotated by copying and
+# truncating it rather than renaming it, and readers handle the truncation.
+
+import os
+import errno
+import time
+import shutil
+
+
+default_max_size = 1024 * 1024
+
+
+def rotated_path(path):
+    return path + ".1"
+
+
+def rotate(path, max_size):
+    if _size(path) < max_size:
+        return
+    
+    # Output written between copying and truncating the file is lost
+    temp_path = rotated_path(path) + ".tmp"
+    shutil.copyfile(path, temp_path)
+    os.rename(temp_path, rotated_path(path))
+    with open(path, "r+b") as output_file:
+        output_file.truncate(0)
+
+
+def tail(path, max_bytes):
+    output = _read_tail(path, max_bytes)
+    if len(output) < max_bytes:
+        output = _read_tail(rotated_path(path), max_bytes - len(output)) + output
+    return output
+
+
+def follow(path, is_finished, max_bytes=None, poll_interval=0.5):
+    rotation_key = _file_key(rotated_path(path))
+    output_file = _open(path)
+    finished = False
+    try:
+        if output_file is None:
+            current_size = 0
+        else:
+            current_size = os.fstat(output_file.fileno()).st_size
+        
+        if max_bytes is None:
+            rotated_output = _read_tail(rotated_path(path), _size(rotated_path(path)))
+        else:
+            rotated_output = _read_tail(rotated_path(path), max_bytes - current_size)
+            if output_file is not None:
+                output_file.seek(max(0, current_size - max_bytes))
+        if rotated_output:
+            yield rotated_output
+        
+        while True:
+            if output_file is None:
+                output_file = _open(path)
+            
+            if output_file is not None and _file_key(rotated_path(path)) != rotation_key:
+                # The output has been copied to the rotated file and truncated
+                # since it was last read, so read the rest of the copy and
+                # carry on from the start of the truncated file
+                rotation_key = _file_key(rotated_path(path))
+                data = _read_from(rotated_path(path), output_file.tell())
+                output_file.seek(0)
+            elif output_file is None:
+                data = ""
+            else:
+                data = output_file.read(64 * 1024)
+            
+            if data:
+                yield data
+            elif finished:
+                return
+            else:
+                # Read once more after finishing in case of any output
+                # written just before finishing
+                finished = is_finished()
+                if not finished:
+                    time.sleep(poll_interval)
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+
+def _read_tail(path, max_bytes):
+    if max_bytes <= 0:
+        return ""
+    output_file = _open(path)
+    if output_file is None:
+        return ""
+    with output_file:
+        output_file.seek(0, os.SEEK_END)
+        output_file.seek(max(0, output_file.tell() - max_bytes))
+        return output_file.read()
+
+
+def _read_from(path, offset):
+    output_file = _open(path)
+    if output_file is None:
+        return ""
+    with output_file:
+        output_file.seek(offset)
+        return output_file.read()
+
+
+def _file_key(path):
+    # The rotated file is replaced on each rotation
+    try:
+        stat = os.stat(path)
+    except OSError as error:
+        if error.errno == errno.ENOENT:
+            return None
+        else:
+            raise
+    return (stat.st_ino, stat.st_mtime)
+
+
+def _open(path):
+    try:
+        return open(path, "rb")
+    except IOError as error:
+        if error.errno == errno.ENOENT:
+            return None
+        else:
+            raise
+
+
+def _size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError as error:
+        if error.errno == errno.ENOENT:
+            return 0
+        else:
+            raise
@@ -1,33 +1,51 @@
 import os
 import errno
 import json
+import sys
+import time
+import select
+import threading
+import ctypes
+import signal
+import subprocess
 
-import spur
 import psutil
 
 from . import dictobj
+from . import outputlog
 
 
-local_shell = spur.LocalShell()
+_default_grace_period = 10
 
 
-def start(commands, storage_dir):
+def start(commands, storage_dir, run_directory=None):
+    if run_directory is None:
+        run_directory = RunDirectory
     if not os.path.exists(storage_dir):
         os.makedirs(storage_dir)
-    run_dir = RunDirectory(storage_dir)
+    run_dir = run_directory(storage_dir)
     process_set = ProcessSet(run_dir, {})
     process_set.start(commands)
     return process_set
 
 
-def from_dir(run_dir):
-    run_dir = RunDirectory(run_dir)
+def from_dir(run_dir, run_directory=None):
+    if run_directory is None:
+        run_directory = RunDirectory
+    run_dir = run_directory(run_dir)
     names = run_dir.read_names()
     process_infos = map(run_dir.read_process_info, names)
         
     return ProcessSet(run_dir, dict(zip(names, process_infos)))
 
 
+def all_running_each(process_sets):
+    return [
+        all(map(_process_is_running, process_set.process_infos()))
+        for process_set in process_sets
+    ]
+
+
 ProcessInfo = dictobj.data_class("ProcessInfo", ["pid", "start_time"])
     
     
@@ -47,11 +65,16 @@ class ProcessSet(object):
         
         def start_process((name, command_args)):
             output_file = self._run_dir.output_path(name)
-            command = " ".join(map(_escape_sh, command_args))
-            redirected_command = ["sh", "-c", "exec {0} > {1} 2>&1".format(command, output_file)]
-            process = local_shell.spawn(redirected_command, store_pid=True)
+            process, stdin_fd = _spawn(command_args, output_file)
             process_info = _process_info_for_pid(process.pid)
             self._run_dir.write_process_info(name, process_info)
+            
+            def on_exit():
+                os.close(stdin_fd)
+                # Reap the process so that it doesn't linger as a zombie
+                process.poll()
+            
+            supervisor.watch(process_info).add_done_callback(on_exit)
                 
             return (name, process_info)
             
@@ -63,32 +86,72 @@ class ProcessSet(object):
     def any_running(self):
         return any(self._is_running_each_process())
     
-    def all_output(self):
+    def all_output(self, max_bytes=None):
         names = sorted(self._processes.keys())
         return "".join(
-            "{0}:\n{1}".format(name, _indent(self._output(name)))
+            "{0}:\n{1}".format(name, _indent(self.output(name, max_bytes=max_bytes)))
             for name in names
         )
+    
+    def output(self, name, max_bytes=None):
+        output_path = self._run_dir.output_path(name)
+        if max_bytes is None:
+            return outputlog.tail(output_path, _total_output_size(output_path))
+        else:
+            return outputlog.tail(output_path, max_bytes)
+    
+    def follow_output(self, name, max_bytes=None):
+        process_exit = supervisor.watch(self._processes[name])
+        return outputlog.follow(self._run_dir.output_path(name), process_exit.has_exited, max_bytes=max_bytes)
+    
+    def rotate_output(self, max_size=outputlog.default_max_size):
+        # Output is only capped when this is called, such as by cron
+        for name in self._processes.iterkeys():
+            outputlog.rotate(self._run_dir.output_path(name), max_size)
+        
+    def kill_all(self, grace_period=None):
+        if grace_period is None:
+            grace_period = _default_grace_period
         
-    def kill_all(self):
         for process_info in self._processes.itervalues():
-            _kill(process_info)
+            _kill(process_info, signal.SIGTERM)
+        
+        if not self.wait_for_exit(timeout=grace_period):
+            for process_info in self._processes.itervalues():
+                _kill(process_info, signal.SIGKILL)
+            self.wait_for_exit(timeout=grace_period)
+    
+    def exits(self):
+        return [supervisor.watch(process_info) for process_info in self._processes.itervalues()]
+    
+    def wait_for_exit(self, timeout):
+        deadline = time.time() + timeout
+        for process_exit in self.exits():
+            if not process_exit.wait(max(0, deadline - time.time())):
+                return False
+        return True
+    
+    def exit_event(self):
+        # Set as soon as any process in the set exits
+        event = threading.Event()
+        for process_exit in self.exits():
+            process_exit.add_done_callback(event.set)
+        return event
             
     
+    def process_infos(self):
+        return self._processes.values()
+    
     def _is_running_each_process(self):
         return map(_process_is_running, self._processes.itervalues())
-    
-    def _output(self, name):
-        # TODO: remove duplication
-        output_file = os.path.join(self.run_dir, "{0}.output".format(name))
-        try:
-            with open(output_file) as output:
-                return output.read()
-        except IOError as error:
-            if error.errno == errno.ENOENT:
-                return ""
-            else:
-                raise
+
+
+def _total_output_size(output_path):
+    return sum(
+        os.path.getsize(path)
+        for path in [output_path, outputlog.rotated_path(output_path)]
+        if os.path.exists(path)
+    )
 
 
 def _indent(string):
@@ -104,18 +167,229 @@ def _indent(string):
 
 
 def _process_is_running(process_info):
+    if _has_proc_stat:
+        return _process_is_running_from_proc_stat(process_info)
+    
     try:
         process = psutil.Process(process_info.pid)
+        if process.status in [psutil.STATUS_DEAD, psutil.STATUS_ZOMBIE]:
+            return False
+        return process.create_time == process_info.start_time
     except psutil.NoSuchProcess:
         return False
-    if process.status in [psutil.STATUS_DEAD, psutil.STATUS_ZOMBIE]:
+
+
+_has_proc_stat = sys.platform.startswith("linux")
+
+_clock_ticks = os.sysconf("SC_CLK_TCK") if _has_proc_stat else None
+
+
+def _process_is_running_from_proc_stat(process_info):
+    # psutil reads a separate file for each of the status and the start
+    # time, whereas /proc/<pid>/stat has both
+    try:
+        with open("/proc/{0}/stat".format(process_info.pid)) as stat_file:
+            stat = stat_file.read()
+    except IOError as error:
+        # ENOENT, ESRCH: Process has exited
+        if error.errno in [errno.ENOENT, errno.ESRCH]:
+            return False
+        else:
+            raise
+    
+    # The command name is in parentheses and may contain spaces
+    fields = stat[stat.rfind(")") + 2:].split(" ")
+    state, start_ticks = fields[0], fields[19]
+    if state in ["Z", "X", "x"]:
         return False
-    return _process_info_for_pid(process_info.pid) == process_info
+    # Calculated in the same way as psutil, so that it equals start times
+    # read through psutil
+    start_time = (float(start_ticks) / _clock_ticks) + psutil.BOOT_TIME
+    return start_time == process_info.start_time
 
 
-def _kill(process_info):
+def _spawn(command_args, output_path):
+    # Remove output from any previous process with the same name
+    rotated_output_path = outputlog.rotated_path(output_path)
+    if os.path.exists(rotated_output_path):
+        os.remove(rotated_output_path)
+    
+    # Keep stdin open until the process exits, as it was when processes
+    # were spawned through a shell
+    stdin_read_fd, stdin_write_fd = os.pipe()
+    try:
+        # Appending allows the output to be rotated by truncating it while
+        # the process is running
+        output_fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0666)
+        try:
+            process = subprocess.Popen(
+                command_args,
+                stdin=stdin_read_fd,
+                stdout=output_fd,
+                stderr=subprocess.STDOUT,
+                close_fds=True,
+            )
+        finally:
+            os.close(output_fd)
+    except:
+        os.close(stdin_write_fd)
+        raise
+    finally:
+        os.close(stdin_read_fd)
+    return process, stdin_write_fd
+
+
+def _kill(process_info, signal_number):
     if _process_is_running(process_info):
-        local_shell.run(["kill", str(process_info.pid)])
+        try:
+            os.kill(process_info.pid, signal_number)
+        except OSError as error:
+            # ESRCH: Process has exited in the interim
+            if error.errno != errno.ESRCH:
+                raise
+
+class ProcessExit(object):
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+    
+    def has_exited(self):
+        return self._event.is_set()
+    
+    def wait(self, timeout):
+        self._event.wait(timeout)
+        return self._event.is_set()
+    
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+    
+    def _set(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class Supervisor(object):
+    _poll_interval = 0.1
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._exits = {}
+        self._pidfds = {}
+        self._polled = {}
+        self._epoll = None
+        self._thread = None
+    
+    def watch(self, process_info):
+        key = (process_info.pid, process_info.start_time)
+        with self._lock:
+            process_exit = self._exits.get(key, None)
+            if process_exit is not None:
+                return process_exit
+            
+            process_exit = ProcessExit()
+            pidfd = _pidfd_open(process_info.pid)
+            # Checking after opening the pidfd ensures that the pidfd refers
+            # to the same process, rather than a process that reused its pid
+            if not _process_is_running(process_info):
+                if pidfd is not None:
+                    os.close(pidfd)
+                process_exit._set()
+                return process_exit
+            
+            self._exits[key] = process_exit
+            if pidfd is None:
+                self._polled[key] = process_info
+            else:
+                if self._epoll is None:
+                    self._epoll = select.epoll()
+                self._pidfds[pidfd] = key
+                self._epoll.register(pidfd, select.EPOLLIN)
+            
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._supervise)
+                self._thread.daemon = True
+                self._thread.start()
+            
+            return process_exit
+    
+    def _supervise(self):
+        while True:
+            with self._lock:
+                epoll = self._epoll
+                polled = self._polled.items()
+            
+            if epoll is None:
+                time.sleep(self._poll_interval)
+                ready_fds = []
+            else:
+                # Processes watched by polling need checking periodically,
+                # and registering a pidfd doesn't wake a blocked poll
+                ready_fds = [fd for fd, event in epoll.poll(self._poll_interval if polled else 1)]
+            
+            exited_keys = [
+                key
+                for key, process_info in polled
+                if not _process_is_running(process_info)
+            ]
+            
+            with self._lock:
+                for fd in ready_fds:
+                    epoll.unregister(fd)
+                    os.close(fd)
+                    exited_keys.append(self._pidfds.pop(fd))
+                for key in exited_keys:
+                    self._polled.pop(key, None)
+                process_exits = [self._exits.pop(key) for key in exited_keys]
+            
+            for process_exit in process_exits:
+                process_exit._set()
+
+
+supervisor = Supervisor()
+
+
+_pidfd_open_syscall = 434
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+
+_libc = _load_libc()
+
+
+def _pidfd_open(pid):
+    global _libc
+    if _libc is None:
+        return None
+    
+    pidfd = _libc.syscall(_pidfd_open_syscall, pid, 0)
+    if pidfd >= 0:
+        return pidfd
+    
+    error = ctypes.get_errno()
+    if error == errno.ESRCH:
+        return None
+    elif error in [errno.ENOSYS, errno.EPERM, errno.EINVAL]:
+        # pidfd_open was added in Linux 5.3, and may be blocked by seccomp,
+        # so fall back to polling
+        _libc = None
+        return None
+    else:
+        raise OSError(error, os.strerror(error))
+
 
 def _process_info_for_pid(pid):
     start_time = _process_start_time_from_pid(pid)
@@ -124,10 +398,6 @@ def _process_info_for_pid(pid):
 
 def _process_start_time_from_pid(pid):
     return psutil.Process(pid).create_time
-    
-    
-def _escape_sh(value):
-    return "'" + value.replace("'", "'\\''") + "'"
 
 
 class RunDirectory(object):
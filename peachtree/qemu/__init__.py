@@ -1,5 +1,7 @@
-from .provider import qemu_provider, UserNetworking
+from .provider import qemu_provider, UserNetworking, BridgeNetworking
 from .images import Images
+from .pools import pool_size
+from .admission import AdmissionError
 
 
-__all__ = ["qemu_provider", "UserNetworking", "Images"]
+__all__ = ["qemu_provider", "UserNetworking", "BridgeNetworking", "Images", "pool_size", "AdmissionError"]
@@ -0,0 +1,120 @@
+import threading
+import contextlib
+import time
+
+from ..common import START_MACHINE_TIMEOUT
+
+
+class AdmissionError(RuntimeError):
+    pass
+
+
+class AdmissionController(object):
+    def __init__(self, statuses, max_memory_size=None, max_cpus=None, queue_timeout=START_MACHINE_TIMEOUT, poll_interval=1):
+        self._statuses = statuses
+        self._max_memory_size = max_memory_size
+        self._max_cpus = max_cpus
+        self._queue_timeout = queue_timeout
+        self._poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._reservations = {}
+    
+    @contextlib.contextmanager
+    def admit(self, identifier, memory_size, cpus):
+        self._reserve(identifier, memory_size, cpus)
+        try:
+            yield
+        finally:
+            with self._condition:
+                del self._reservations[identifier]
+                self._condition.notify_all()
+    
+    @contextlib.contextmanager
+    def admit_growth(self, status, memory_size):
+        growth = memory_size - _committed_memory_size(status)
+        if growth <= 0:
+            yield
+        else:
+            # The machine is already counted from its status, so only the
+            # growth is reserved, separately from the machine's identifier
+            with self.admit((status.identifier, "growth"), growth, cpus=0):
+                yield
+    
+    def _reserve(self, identifier, memory_size, cpus):
+        if not self._fits((0, 0), memory_size, cpus):
+            raise AdmissionError(
+                "Machine requires {0}, which exceeds the host limit of {1}".format(
+                    _describe(memory_size, cpus),
+                    _describe(self._max_memory_size, self._max_cpus),
+                )
+            )
+        
+        start_time = time.time()
+        with self._condition:
+            while True:
+                if self._max_memory_size is None and self._max_cpus is None:
+                    committed = (0, 0)
+                else:
+                    committed = self._committed()
+                if self._fits(committed, memory_size, cpus):
+                    self._reservations[identifier] = (memory_size, cpus)
+                    return
+                
+                remaining_time = self._queue_timeout - (time.time() - start_time)
+                if remaining_time <= 0:
+                    raise AdmissionError(
+                        "Timed out after {0} seconds waiting for host capacity: "
+                        "machine requires {1}, {2} of {3} already committed".format(
+                            self._queue_timeout,
+                            _describe(memory_size, cpus),
+                            _describe(*committed),
+                            _describe(self._max_memory_size, self._max_cpus),
+                        )
+                    )
+                # Machines stopped by other processes won't notify us, so
+                # check again periodically
+                self._condition.wait(min(remaining_time, self._poll_interval))
+    
+    def _fits(self, committed, memory_size, cpus):
+        committed_memory_size, committed_cpus = committed
+        return (
+            _within_limit(committed_memory_size + memory_size, self._max_memory_size) and
+            _within_limit(committed_cpus + cpus, self._max_cpus)
+        )
+    
+    def _committed(self):
+        statuses = self._statuses.read_running()
+        identifiers = set(status.identifier for status in statuses)
+        # A machine being started is reserved until its status is written
+        reservations = [
+            reservation
+            for identifier, reservation in self._reservations.iteritems()
+            if identifier not in identifiers
+        ]
+        allocations = [
+            (_committed_memory_size(status), status.cpus)
+            for status in statuses
+        ] + reservations
+        return (
+            sum(memory_size for memory_size, cpus in allocations),
+            sum(cpus for memory_size, cpus in allocations),
+        )
+
+
+def _committed_memory_size(status):
+    # Memory reclaimed by the balloon is available to other machines
+    if status.memory_target is None:
+        return status.memory_size
+    else:
+        return status.memory_target
+
+
+def _within_limit(value, limit):
+    return limit is None or value <= limit
+
+
+def _describe(memory_size, cpus):
+    return "{0}MB of memory and {1} vCPUs".format(
+        "unlimited" if memory_size is None else memory_size,
+        "unlimited" if cpus is None else cpus,
+    )
@@ -4,3 +4,16 @@ import os
 def default_data_dir():
     xdg_data_home = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
     return os.path.join(xdg_data_home, "peachtree-0.3/qemu")
+
+
+def overlay_path(overlay_dir, index):
+    return os.path.join(overlay_dir, "disk-{0}.qcow2".format(index))
+
+
+def escape_sh(value):
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def escape_qemu_option(value):
+    # Commas separate options, so commas within a value are doubled
+    return value.replace(",", ",,")
@@ -0,0 +1,57 @@
+_cache_modes = ["none", "writeback", "writethrough", "directsync", "unsafe"]
+_aio_backends = ["threads", "native", "io_uring"]
+
+_default_disk_options = {
+    "cache": None,
+    "aio": None,
+    "iothread": False,
+    "discard": False,
+}
+
+
+def disk_options(*options_dicts):
+    # Later options override earlier options, such as request options
+    # overriding image options
+    options = dict(_default_disk_options)
+    for options_dict in options_dicts:
+        for key, value in (options_dict or {}).iteritems():
+            if key not in options:
+                raise ValueError("Unknown disk option: {0}".format(key))
+            options[key] = value
+    
+    if options["cache"] is not None and options["cache"] not in _cache_modes:
+        raise ValueError("Unknown disk cache mode: {0}".format(options["cache"]))
+    if options["aio"] is not None and options["aio"] not in _aio_backends:
+        raise ValueError("Unknown disk aio backend: {0}".format(options["aio"]))
+    # Native AIO requires O_DIRECT, which QEMU only uses for these modes
+    if options["aio"] == "native" and options["cache"] not in ["none", "directsync"]:
+        raise ValueError("Native disk aio requires cache mode none or directsync")
+    
+    return options
+
+
+def qemu_args(disks, options):
+    drive_options = []
+    if options["cache"] is not None:
+        drive_options.append("cache={0}".format(options["cache"]))
+    if options["aio"] is not None:
+        drive_options.append("aio={0}".format(options["aio"]))
+    if options["discard"]:
+        drive_options.append("discard=unmap")
+    
+    args = []
+    if options["iothread"]:
+        # Each disk has its own iothread so that I/O on one disk doesn't
+        # wait for I/O on another, or for the main loop
+        for index, disk in enumerate(disks):
+            drive_id = "disk{0}".format(index)
+            iothread_id = "iothread{0}".format(index)
+            args += [
+                "-object", "iothread,id={0}".format(iothread_id),
+                "-drive", ",".join(["file={0}".format(disk), "if=none", "id={0}".format(drive_id)] + drive_options),
+                "-device", "virtio-blk-pci,drive={0},iothread={1}".format(drive_id, iothread_id),
+            ]
+    else:
+        for disk in disks:
+            args += ["-drive", ",".join(["file={0}".format(disk), "if=virtio"] + drive_options)]
+    return args
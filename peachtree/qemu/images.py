@@ -1,8 +1,13 @@
 import os
 import json
+import errno
+import uuid
+import collections
+import threading
 
 from .. import dictobj
-from .common import default_data_dir as _default_data_dir
+from . import drives
+from .common import default_data_dir as _default_data_dir, overlay_path
 from ..users import User
 
 
@@ -10,6 +15,8 @@ class Images(object):
     def __init__(self, data_dir=None):
         data_dir = data_dir or _default_data_dir()
         self._images_dir = os.path.join(data_dir, "images")
+        self._lock = threading.Lock()
+        self._cache = {}
     
     def all(self):
         return sorted(
@@ -20,16 +27,51 @@ class Images(object):
     def image_path(self, image_name):
         return os.path.join(self._images_dir, image_name)
     
+    def new_resume_snapshot_path(self, image_name):
+        return os.path.join(
+            self.image_path(image_name),
+            "resume-snapshots",
+            str(uuid.uuid4())
+        )
+    
+    def set_resume_snapshot(self, image_name, snapshot_path):
+        image_dir = self.image_path(image_name)
+        description = self._read_description(image_name)
+        description["resumeSnapshot"] = os.path.relpath(snapshot_path, image_dir)
+        
+        description_path = self._description_path(image_name)
+        temp_description_path = description_path + ".tmp"
+        with open(temp_description_path, "w") as description_file:
+            json.dump(description, description_file, indent=4, separators=(',', ': '))
+            description_file.write("\n")
+        os.rename(temp_description_path, description_path)
+    
     def image(self, image_name):
+        description_key = _file_key(os.stat(self._description_path(image_name)))
+        with self._lock:
+            cached = self._cache.get(image_name, None)
+        if cached is not None:
+            cached_description_key, snapshot_path, snapshot_key, image = cached
+            if cached_description_key == description_key and _resume_snapshot_key(snapshot_path) == snapshot_key:
+                return image
+        
+        image, snapshot_path, snapshot_key = self._read_image(image_name)
+        with self._lock:
+            self._cache[image_name] = (description_key, snapshot_path, snapshot_key, image)
+        return image
+    
+    def _read_image(self, image_name):
         image_dir = self.image_path(image_name)
-        with open(os.path.join(image_dir, "image.json")) as description_file:
-            description = json.load(description_file)
+        description = self._read_description(image_name)
         relative_disks = description["disks"]
         disks = [
             os.path.abspath(os.path.join(image_dir, relative_disk))
             for relative_disk in relative_disks
         ]
         memory_size = description.get("memory", 512)
+        cpus = description.get("cpus", 1)
+        cpu_model = description.get("cpuModel", None)
+        image_disk_options = drives.disk_options(description.get("diskOptions", None))
         
         users_json = description.get("users", None)
         if users_json is None:
@@ -46,22 +88,137 @@ class Images(object):
             
         operating_system_family = description.get("operatingSystemFamily", "linux")
         ssh_internal_port = description.get("sshPort", 22)
-            
-        return Image(
+        readiness_channel = description.get("readinessChannel", None)
+        memory_balloon = description.get("memoryBalloon", False)
+        
+        image = Image(
             name=image_name,
             disks=disks,
             memory_size=memory_size,
+            cpus=cpus,
+            cpu_model=cpu_model,
+            disk_options=image_disk_options,
             users=users,
             operating_system_family=operating_system_family,
             ssh_internal_port=ssh_internal_port,
+            resume_snapshot=None,
+            readiness_channel=readiness_channel,
+            memory_balloon=memory_balloon,
         )
+        
+        relative_resume_snapshot = description.get("resumeSnapshot", None)
+        if relative_resume_snapshot is None:
+            snapshot_path = None
+        else:
+            snapshot_path = os.path.join(image_dir, relative_resume_snapshot)
+        # Read before the snapshot itself, so that the snapshot is read again
+        # if it changes in the interim
+        snapshot_key = _resume_snapshot_key(snapshot_path)
+        if snapshot_path is not None:
+            image.resume_snapshot = _read_resume_snapshot(snapshot_path, image)
+        return image, snapshot_path, snapshot_key
+    
+    def _read_description(self, image_name):
+        with open(self._description_path(image_name)) as description_file:
+            return json.load(description_file, object_pairs_hook=collections.OrderedDict)
+    
+    def _description_path(self, image_name):
+        return os.path.join(self.image_path(image_name), "image.json")
+
+
+def _resume_snapshot_key(snapshot_path):
+    # The files of a snapshot may be created or removed without image.json
+    # changing
+    if snapshot_path is None:
+        return None
+    paths = [
+        resume_snapshot_state_path(snapshot_path),
+        _resume_snapshot_config_path(snapshot_path),
+    ]
+    keys = []
+    for path in paths:
+        try:
+            keys.append(_file_key(os.stat(path)))
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                keys.append(None)
+            else:
+                raise
+    return keys
+
+
+def _file_key(stat):
+    # Files are usually replaced rather than modified in place, so the inode
+    # is included to detect changes within the mtime resolution
+    return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+
+def resume_snapshot_state_path(snapshot_path):
+    return os.path.join(snapshot_path, "state")
+
+
+def write_resume_snapshot_config(snapshot_path, image):
+    with open(_resume_snapshot_config_path(snapshot_path), "w") as config_file:
+        json.dump(_resume_snapshot_config(image), config_file)
+
+
+def _resume_snapshot_config_path(snapshot_path):
+    return os.path.join(snapshot_path, "config.json")
+
+
+def _resume_snapshot_config(image):
+    # Restoring a snapshot requires the same memory and devices as the
+    # machine that the snapshot was taken from
+    return {
+        "disks": len(image.disks),
+        "memory": image.memory_size,
+        "cpus": image.cpus,
+        "cpuModel": image.cpu_model,
+        "iothread": image.disk_options["iothread"],
+        "readinessChannel": image.readiness_channel,
+        "memoryBalloon": image.memory_balloon,
+    }
+
+
+def _read_resume_snapshot(snapshot_path, image):
+    state_path = resume_snapshot_state_path(snapshot_path)
+    if not os.path.exists(state_path):
+        return None
+    
+    # Snapshots that don't match image.json, for instance because it has been
+    # edited since the snapshot was built, can't be restored
+    try:
+        with open(_resume_snapshot_config_path(snapshot_path)) as config_file:
+            config = json.load(config_file)
+    except IOError as error:
+        if error.errno == errno.ENOENT:
+            return None
+        else:
+            raise
+    if config != _resume_snapshot_config(image):
+        return None
+    
+    disks = [
+        overlay_path(snapshot_path, index)
+        for index in range(len(image.disks))
+    ]
+    return ResumeSnapshot(state_path=state_path, disks=disks)
 
 
 Image = dictobj.data_class("Image", [
     "name",
     "disks",
     "memory_size",
+    "cpus",
+    "cpu_model",
+    "disk_options",
     "users",
     "operating_system_family",
     "ssh_internal_port",
+    "resume_snapshot",
+    "readiness_channel",
+    "memory_balloon",
 ])
+
+
+ResumeSnapshot = dictobj.data_class("ResumeSnapshot", ["state_path", "disks"])
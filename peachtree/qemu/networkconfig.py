@@ -1,5 +1,6 @@
 from .. import wait
 from ..windows import netsh
+from .common import escape_sh
 
 
 def network_config(operating_system_family, shell):
@@ -16,9 +17,16 @@ class NetworkConfigurer(object):
         self._shell = shell
         
     def add_hosts_entry(self, ip_address, hostname):
-        # TODO: properly escape hosts_path
-        sh_command = "echo {0} {1} >> '{2}'".format(
-            ip_address, hostname, self._config.hosts_path
+        self.add_hosts_entries([(ip_address, hostname)])
+    
+    def add_hosts_entries(self, entries):
+        lines = [
+            "{0} {1}".format(ip_address, hostname)
+            for ip_address, hostname in entries
+        ]
+        sh_command = "printf '%s\\n' {0} >> {1}".format(
+            " ".join(map(escape_sh, lines)),
+            escape_sh(self._config.hosts_path),
         )
         self._shell.run(["sh", "-c", sh_command])
 
@@ -0,0 +1,120 @@
+import os
+import errno
+import threading
+import contextlib
+
+
+_sys_devices_system = "/sys/devices/system"
+
+
+class CpuPlacement(object):
+    def __init__(self, statuses, topology=None):
+        if topology is None:
+            topology = read_topology()
+        self._statuses = statuses
+        self._topology = topology
+        self._lock = threading.Lock()
+        self._reservations = {}
+    
+    @contextlib.contextmanager
+    def place(self, identifier, cpus):
+        with self._lock:
+            host_cpus = self._choose_host_cpus(cpus)
+            self._reservations[identifier] = host_cpus
+        try:
+            yield host_cpus
+        finally:
+            with self._lock:
+                del self._reservations[identifier]
+    
+    def _choose_host_cpus(self, cpus):
+        load = self._load()
+        
+        def node_load(node):
+            node_id, node_cpus = node
+            return sum(load.get(host_cpu, 0) for host_cpu in node_cpus) / float(len(node_cpus))
+        
+        # Keep each machine on a single NUMA node if it fits, so that its
+        # memory is local to its vCPUs, and use the least loaded node
+        fitting_nodes = [
+            node for node in self._topology
+            if len(node[1]) >= cpus
+        ]
+        if fitting_nodes:
+            node_id, node_cpus = min(fitting_nodes, key=node_load)
+        else:
+            node_cpus = [host_cpu for node_id, host_cpus in self._topology for host_cpu in host_cpus]
+        
+        # Sorting is stable, so ties are broken by CPU order
+        least_loaded = sorted(node_cpus, key=lambda host_cpu: load.get(host_cpu, 0))
+        return [
+            least_loaded[index % len(least_loaded)]
+            for index in range(cpus)
+        ]
+    
+    def _load(self):
+        statuses = self._statuses.read_running()
+        identifiers = set(status.identifier for status in statuses)
+        # A machine being started is reserved until its status is written
+        placements = [
+            status.host_cpus
+            for status in statuses
+            if status.host_cpus is not None
+        ] + [
+            host_cpus
+            for identifier, host_cpus in self._reservations.iteritems()
+            if identifier not in identifiers
+        ]
+        load = {}
+        for host_cpus in placements:
+            for host_cpu in host_cpus:
+                load[host_cpu] = load.get(host_cpu, 0) + 1
+        return load
+
+
+def read_topology():
+    node_dir = os.path.join(_sys_devices_system, "node")
+    try:
+        node_names = [
+            name for name in os.listdir(node_dir)
+            if name.startswith("node") and name[len("node"):].isdigit()
+        ]
+    except OSError as error:
+        # ENOENT: Kernel without NUMA support
+        if error.errno == errno.ENOENT:
+            node_names = []
+        else:
+            raise
+    
+    topology = []
+    for name in sorted(node_names, key=lambda name: int(name[len("node"):])):
+        node_cpus = _read_cpu_list(os.path.join(node_dir, name, "cpulist"))
+        # Memory-only nodes have no CPUs
+        if node_cpus:
+            topology.append((int(name[len("node"):]), node_cpus))
+    
+    if not topology:
+        topology = [(0, _read_cpu_list(os.path.join(_sys_devices_system, "cpu", "online")))]
+    return topology
+
+
+def _read_cpu_list(path):
+    with open(path) as cpu_list_file:
+        return parse_cpu_list(cpu_list_file.read())
+
+
+def parse_cpu_list(cpu_list):
+    cpus = []
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus += range(int(start), int(end) + 1)
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpu_list(cpus):
+    return ",".join(map(str, sorted(set(cpus))))
@@ -0,0 +1,136 @@
+import threading
+
+from .. import dictobj
+
+
+PoolSize = dictobj.data_class("PoolSize", ["min_size", "max_size"])
+
+# Pooled machines are replaced periodically so that machines left over from
+# pools that are no longer configured, for instance after a restart, are
+# eventually stopped
+pooled_machine_timeout = 60 * 60
+
+
+def pool_size(min_size, max_size=None):
+    if max_size is None:
+        max_size = min_size
+    if min_size < 0 or max_size < min_size:
+        raise ValueError(
+            "Invalid pool size: min {0}, max {1}".format(min_size, max_size)
+        )
+    return PoolSize(min_size, max_size)
+
+
+class PoolStates(object):
+    starting = "starting"
+    ready = "ready"
+
+
+class WarmPools(object):
+    def __init__(self, sizes, statuses, start_machine, machine_from_status):
+        self._sizes = sizes
+        self._statuses = statuses
+        self._start_machine = start_machine
+        self._machine_from_status = machine_from_status
+        self._lock = threading.Lock()
+        self._fillers = {}
+    
+    def claim(self, request, disk_options):
+        if request.image_name not in self._sizes:
+            return None
+        
+        # Devices for shared directories can't be added to running machines
+        if request.shared_directories:
+            return None
+        
+        for status in self._ready_statuses(request.image_name):
+            if not set(request.public_ports).issubset(status.forwarded_ports):
+                continue
+            if request.cpus is not None and request.cpus != status.cpus:
+                continue
+            if request.cpu_model is not None and request.cpu_model != status.cpu_model:
+                continue
+            if status.disk_options != disk_options:
+                continue
+            if not self._statuses.claim(status.identifier):
+                continue
+            machine = self._machine_from_status(status)
+            if machine.is_running():
+                return status
+            else:
+                machine.destroy()
+        
+        return None
+    
+    def refill_in_background(self, image_name=None):
+        if image_name is None:
+            image_names = self._sizes.keys()
+        else:
+            image_names = [image_name]
+        
+        for image_name in image_names:
+            if image_name in self._sizes:
+                self._start_filler(image_name)
+    
+    def reap(self):
+        for image_name, size in self._sizes.iteritems():
+            ready_statuses = self._ready_statuses(image_name)
+            excess_statuses = ready_statuses[size.max_size:]
+            for status in excess_statuses:
+                if self._statuses.claim(status.identifier):
+                    self._machine_from_status(status).destroy()
+    
+    def drain(self):
+        image_names = self._sizes.keys()
+        self._sizes = {}
+        
+        with self._lock:
+            fillers = self._fillers.values()
+        for filler in fillers:
+            filler.join()
+        
+        for image_name in image_names:
+            for status in self._pooled_statuses(image_name):
+                if self._statuses.claim(status.identifier):
+                    self._machine_from_status(status).destroy()
+    
+    def _start_filler(self, image_name):
+        with self._lock:
+            if image_name in self._fillers:
+                return
+            thread = threading.Thread(target=lambda: self._fill(image_name))
+            thread.daemon = True
+            self._fillers[image_name] = thread
+        
+        thread.start()
+    
+    def _fill(self, image_name):
+        try:
+            while self._needs_machine(image_name):
+                self._start_machine(image_name)
+        finally:
+            with self._lock:
+                del self._fillers[image_name]
+    
+    def _needs_machine(self, image_name):
+        size = self._sizes.get(image_name, None)
+        if size is None:
+            return False
+        else:
+            return len(self._pooled_statuses(image_name)) < size.min_size
+    
+    def _ready_statuses(self, image_name):
+        return [
+            status
+            for status in self._pooled_statuses(image_name)
+            if status.pool_state == PoolStates.ready
+        ]
+    
+    def _pooled_statuses(self, image_name):
+        statuses = [
+            status
+            for status in self._statuses.read_by_image(image_name)
+            if status.pool_state is not None and
+                not self._statuses.is_claimed(status.identifier)
+        ]
+        return sorted(statuses, key=lambda status: status.start_time)
@@ -0,0 +1,154 @@
+import os
+import errno
+import random
+import socket
+import time
+
+from ..common import START_MACHINE_TIMEOUT
+
+
+default_port_range = (20000, 32768)
+
+_socket_types = {
+    "tcp": socket.SOCK_STREAM,
+    "udp": socket.SOCK_DGRAM,
+}
+
+
+class PortAllocationError(RuntimeError):
+    pass
+
+
+class PortAllocator(object):
+    def __init__(self, lease_dir, port_range=None, grace_period=START_MACHINE_TIMEOUT * 2):
+        if port_range is None:
+            port_range = default_port_range
+        start, end = port_range
+        if not 0 < start < end <= 65536:
+            raise ValueError("Invalid port range: {0}-{1}".format(start, end))
+        self._lease_dir = lease_dir
+        self._port_range = port_range
+        self._grace_period = grace_period
+    
+    def lease(self, protocol, count):
+        ports = []
+        try:
+            for port in self._candidates():
+                if len(ports) == count:
+                    break
+                # Leasing a port stops other peachtree processes from using
+                # it, but the port may already be in use by something else
+                if self._try_lease(protocol, port):
+                    if _is_free(protocol, port):
+                        ports.append(port)
+                    else:
+                        self._release_one(protocol, port)
+        except:
+            self.release(protocol, ports)
+            raise
+        
+        if len(ports) < count:
+            self.release(protocol, ports)
+            raise PortAllocationError(
+                "Could not lease {0} {1} ports in the range {2}-{3}".format(
+                    count, protocol.upper(), *self._port_range
+                )
+            )
+        return ports
+    
+    def release(self, protocol, ports):
+        for port in ports:
+            self._release_one(protocol, port)
+    
+    def clean(self, statuses):
+        # Leases are recorded in the status of each machine using them, so
+        # leases that no status refers to have been leaked by machines that
+        # failed to start, or ports shared by machines that have all stopped.
+        # Recent leases may belong to machines that are still starting.
+        leased_ports = set(
+            (protocol, port)
+            for status in statuses
+            for protocol, ports in status.leased_ports.iteritems()
+            for port in ports
+        )
+        now = time.time()
+        for protocol, port, lease_time in self._read_leases():
+            if (protocol, port) not in leased_ports and now - lease_time > self._grace_period:
+                self._release_one(protocol, port)
+    
+    def _candidates(self):
+        # Start at a random port so that concurrent leases rarely contend
+        # for the same ports
+        start, end = self._port_range
+        offset = random.randrange(start, end)
+        return range(offset, end) + range(start, offset)
+    
+    def _try_lease(self, protocol, port):
+        _mkdir_p(self._lease_dir)
+        try:
+            fd = os.open(self._lease_path(protocol, port), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except OSError as error:
+            # EEXIST: Port has already been leased
+            if error.errno == errno.EEXIST:
+                return False
+            else:
+                raise
+        os.close(fd)
+        return True
+    
+    def _release_one(self, protocol, port):
+        try:
+            os.remove(self._lease_path(protocol, port))
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+    
+    def _read_leases(self):
+        try:
+            names = os.listdir(self._lease_dir)
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                return []
+            else:
+                raise
+        
+        leases = []
+        for name in names:
+            protocol, separator, port = name.partition("-")
+            if protocol not in _socket_types or not port.isdigit():
+                continue
+            try:
+                lease_time = os.stat(os.path.join(self._lease_dir, name)).st_mtime
+            except OSError as error:
+                # ENOENT: Lease has been released in the interim, so ignore
+                if error.errno == errno.ENOENT:
+                    continue
+                else:
+                    raise
+            leases.append((protocol, int(port), lease_time))
+        return leases
+    
+    def _lease_path(self, protocol, port):
+        return os.path.join(self._lease_dir, "{0}-{1}".format(protocol, port))
+
+
+def _is_free(protocol, port):
+    port_socket = socket.socket(socket.AF_INET, _socket_types[protocol])
+    try:
+        port_socket.bind(("", port))
+        return True
+    except socket.error as error:
+        if error.errno in [errno.EADDRINUSE, errno.EACCES]:
+            return False
+        else:
+            raise
+    finally:
+        port_socket.close()
+
+
+def _mkdir_p(path):
+    try:
+        os.makedirs(path)
+    except OSError as error:
+        if not (error.errno == errno.EEXIST and os.path.isdir(path)):
+            raise
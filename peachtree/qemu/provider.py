@@ -2,41 +2,105 @@ import os
 import uuid
 import time
 import random
+import json
+import shutil
+import socket
+import errno
+import contextlib
 
 import spur
 import spur.ssh
 import starboard
+import psutil
 
 from .. import wait
+from .. import dictobj
+from .. import sshready
+from .. import sshpool
 from ..machines import MachineWrapper, MachineSet
 from .. import processes
 from ..request import request_machine, MachineRequest
 from . import networkconfig
 from .. import futures
 from ..common import START_MACHINE_TIMEOUT
-from .common import default_data_dir as _default_data_dir
-from .images import Images
+from .common import default_data_dir as _default_data_dir, overlay_path
+from .images import Images, resume_snapshot_state_path, write_resume_snapshot_config
 from .statuses import Statuses, MachineStatus
+from .sqlitestatuses import SqliteStatuses
+from .pools import WarmPools, PoolStates, pooled_machine_timeout
+from . import qmp
+from . import readiness
+from . import drives
+from . import shareddirectories
+from .admission import AdmissionController
+from .ports import PortAllocator
+from .placement import CpuPlacement, format_cpu_list
 
 
 local_shell = spur.LocalShell()
 
+_max_error_output_size = 64 * 1024
+_qmp_timeout = 5
+_megabyte = 1024 * 1024
 
-def qemu_provider(command=None, accel_arg=None, networking=None, data_dir=None):
+
+def qemu_provider(command=None, accel_arg=None, networking=None, data_dir=None, warm_pools=None, img_command=None, overlay_dir=None, max_concurrent_starts=None, max_memory_size=None, max_cpus=None, admission_timeout=None, status_backend=None, idle_memory_size=None, port_range=None, cpu_placement=None, shared_directory_backend=None):
     if accel_arg is None:
         accel_arg = "kvm:tcg"
     
     if command is None:
         command = _find_qemu_command()
     
+    if img_command is None:
+        img_command = "qemu-img"
+    
     if networking is None:
         networking = UserNetworking()
         
     data_dir = data_dir or _default_data_dir()
     images = Images(data_dir)
-    invoker = QemuInvoker(command, accel_arg)
-    statuses = Statuses(os.path.join(data_dir, "status"))
-    return Provider(invoker, images, networking, statuses)
+    invoker = QemuInvoker(
+        command, accel_arg, img_command,
+        shareddirectories.shared_directory_backend(shared_directory_backend),
+    )
+    statuses = _create_statuses(data_dir, overlay_dir, status_backend, images)
+    admission = AdmissionController(
+        statuses,
+        max_memory_size=max_memory_size,
+        max_cpus=max_cpus,
+        queue_timeout=START_MACHINE_TIMEOUT if admission_timeout is None else admission_timeout,
+    )
+    ports = PortAllocator(os.path.join(data_dir, "ports"), port_range=port_range)
+    if cpu_placement is None:
+        placement = None
+    elif cpu_placement == "spread":
+        placement = CpuPlacement(statuses)
+    else:
+        raise ValueError("Unknown CPU placement: {0}".format(cpu_placement))
+    return Provider(
+        invoker, images, networking, statuses, ports,
+        warm_pools=warm_pools,
+        max_concurrent_starts=max_concurrent_starts,
+        admission=admission,
+        idle_memory_size=idle_memory_size,
+        placement=placement,
+    )
+
+
+def _create_statuses(data_dir, overlay_dir, backend, images):
+    status_dir = os.path.join(data_dir, "status")
+    database_path = os.path.join(data_dir, "status.sqlite")
+    if backend is None:
+        # Once created, the database is used by every process sharing the
+        # data directory
+        backend = "sqlite" if os.path.exists(database_path) else "files"
+    
+    if backend == "files":
+        return Statuses(status_dir, overlay_dir=overlay_dir, images=images)
+    elif backend == "sqlite":
+        return SqliteStatuses(database_path, status_dir, overlay_dir=overlay_dir, images=images)
+    else:
+        raise ValueError("Unknown status backend: {0}".format(backend))
 
 
 def _find_qemu_command():
@@ -47,20 +111,36 @@ def _find_qemu_command():
 
 
 class Provider(object):
-    def __init__(self, invoker, images, networking, statuses):
+    def __init__(self, invoker, images, networking, statuses, ports, warm_pools=None, max_concurrent_starts=None, admission=None, idle_memory_size=None, placement=None):
         self._invoker = invoker
         self._images = images
         self._networking = networking
         self._statuses = statuses
+        self._ports = ports
+        self._max_concurrent_starts = max_concurrent_starts
+        if admission is None:
+            admission = AdmissionController(statuses)
+        self._admission = admission
+        self._idle_memory_size = idle_memory_size
+        self._placement = placement
+        self._pools = WarmPools(
+            warm_pools or {},
+            statuses,
+            self._start_pooled_machine,
+            self._machine_from_status,
+        )
     
     def start(self, *args, **kwargs):
         if len(args) == 1 and not kwargs and isinstance(args[0], MachineRequest):
             request = args[0]
         else:
             request = request_machine(*(["peachtree"] + list(args)), **kwargs)
-        image = self._images.image(request.image_name)
-        network = self._networking.settings_for(image, request)
-        machine = self._start_with_network_settings(request, network)
+        
+        machine = self._claim_pooled_machine(request)
+        if machine is None:
+            image = self._images.image(request.image_name)
+            network = self._networking.settings_for(image, request, self._ports)
+            machine = self._start_with_network_settings(request, network)
         
         with machine.root_shell() as root_shell:
             config = self._guest_network_config_for(machine, root_shell)
@@ -68,152 +148,539 @@ class Provider(object):
         
         return machine
             
-    def start_many(self, requests):
+    def start_many(self, requests, max_concurrency=None):
         # TODO: assert name of each request is unique
-        network = self._networking.start_network()
+        if max_concurrency is None:
+            max_concurrency = self._max_concurrent_starts
+        
+        network = self._networking.start_network(self._ports)
+        started_machines = []
         
         def start(request):
             image = self._images.image(request.image_name)
-            network_settings = network.settings_for(image, request)
-            return self._start_with_network_settings(request, network_settings)
+            network_settings = network.settings_for(image, request, self._ports)
+            machine = self._start_with_network_settings(request, network_settings)
+            started_machines.append(machine)
+            return machine
         
-        machines = list(futures.thread_map(start, requests))
+        try:
+            machines = futures.thread_map(start, requests, max_workers=max_concurrency)
+            self._configure_internal_network(machines, requests, max_concurrency)
+        except:
+            for machine in started_machines:
+                machine.destroy()
+            raise
         
-        addresses = []
-        for index, machine in enumerate(machines):
-            request = requests[index]
-            
-            eth1_address = "192.168.0.{0}".format(1 + index)
-            netmask = "255.255.255.0"
-            with machine.root_shell() as root_shell:
-                config = self._guest_network_config_for(machine, root_shell)
-                config.configure_internal_interface(eth1_address, netmask)
-                addresses.append((request.name, eth1_address))
+        return MachineSet(machines)
+    
+    def _configure_internal_network(self, machines, requests, max_concurrency):
+        netmask = "255.255.255.0"
+        addresses = [
+            "192.168.0.{0}".format(1 + index)
+            for index in range(len(machines))
+        ]
+        hosts_entries = [
+            (address, request.name)
+            for address, request in zip(addresses, requests)
+        ]
         
-        for machine in machines:
+        def configure_network((machine, address)):
             with machine.root_shell() as root_shell:
                 config = self._guest_network_config_for(machine, root_shell)
-                for hostname, address in addresses:
-                    config.add_hosts_entry(address, hostname)
+                config.configure_internal_interface(address, netmask)
+                config.add_hosts_entries(hosts_entries)
         
-        return MachineSet(machines)
+        futures.thread_map(
+            configure_network, zip(machines, addresses),
+            max_workers=max_concurrency
+        )
     
     def _guest_network_config_for(self, machine, shell):
         image = self._images.image(machine.image_name)
         os_family = image.operating_system_family
         return networkconfig.network_config(os_family, shell)
 
-    def _start_with_network_settings(self, request, network):
+    def _claim_pooled_machine(self, request):
         image = self._images.image(request.image_name)
+        # Pooled machines were started with the image's disk options, so
+        # compare the options that the request would start a machine with
+        disk_options = drives.disk_options(image.disk_options, request.disk_options)
+        pooled_status = self._pools.claim(request, disk_options)
+        if pooled_status is None:
+            return None
+        
+        self._pools.refill_in_background(request.image_name)
+        
+        status = pooled_status
+        status.name = request.name
+        status.timeout = request.timeout
+        status.start_time = time.time()
+        status.timeout_extension = 0
+        status.pool_state = None
+        self._statuses.write(status)
+        
+        machine = self._machine_from_status(status)
+        if status.memory_target is not None:
+            try:
+                machine.set_memory_size(status.memory_size)
+            except:
+                machine.destroy()
+                raise
+        return machine
+    
+    def _start_pooled_machine(self, image_name):
+        request = request_machine("peachtree", image_name)
+        image = self._images.image(image_name)
+        network = self._networking.settings_for(image, request, self._ports)
+        self._start_with_network_settings(request, network, pooled=True)
+        
+    def _start_with_network_settings(self, request, network, pooled=False):
+        image = self._images.image(request.image_name)
+        identifier = str(uuid.uuid4())
+        
+        disk_dir = self._statuses.disk_dir(identifier)
+        cpus = request.cpus or image.cpus
+        cpu_model = request.cpu_model or image.cpu_model
+        disk_options = drives.disk_options(image.disk_options, request.disk_options)
+        directories = shareddirectories.shared_directories(
+            request.shared_directories,
+            lambda tag: self._statuses.socket_path(identifier, tag),
+        )
+        snapshot = self._resume_snapshot_for(image, network, cpus, cpu_model, disk_options, directories)
+        self._statuses.create_socket_dir(identifier)
+        readiness_socket_path = self._statuses.socket_path(identifier, "readiness")
+        qmp_path = self._statuses.socket_path(identifier, "qmp")
+        
+        try:
+            # The reservation is held until the status has been written, after
+            # which the machine is counted from its status
+            with self._reserve(identifier, image.memory_size, cpus) as host_cpus:
+                hardware = Hardware(
+                    cpus=cpus,
+                    cpu_model=cpu_model,
+                    host_cpus=host_cpus,
+                    disk_options=disk_options,
+                    shared_directories=directories,
+                )
+                process_set = processes.start(
+                    {},
+                    self._statuses.process_storage_dir(identifier),
+                    run_directory=self._statuses.run_directory,
+                )
+                try:
+                    self._start_qemu(image, network, hardware, process_set, disk_dir, snapshot, readiness_socket_path, qmp_path)
+                    
+                    status = MachineStatus(
+                        name=request.name,
+                        identifier=identifier,
+                        image_name=request.image_name,
+                        ssh_internal_port=image.ssh_internal_port,
+                        # TODO: either re-couple network, or find a better way of
+                        # storing network details
+                        forwarded_ports=network.forwarded_ports,
+                        leased_ports=network.leased_ports,
+                        timeout=pooled_machine_timeout if pooled else request.timeout,
+                        start_time=time.time(),
+                        process_set_run_dir=process_set.run_dir,
+                        pool_state=PoolStates.starting if pooled else None,
+                        disk_dir=disk_dir,
+                        memory_size=image.memory_size,
+                        cpus=cpus,
+                        cpu_model=cpu_model,
+                        host_cpus=host_cpus,
+                        disk_options=disk_options,
+                        memory_target=None,
+                        paused_time=None,
+                        pause_extends_timeout=False,
+                        timeout_extension=0,
+                    )
+                    
+                    self._statuses.write(status)
+                except:
+                    # QEMU and virtiofsd may already be running, for instance
+                    # if pinning vCPUs failed, and without a status cron
+                    # can't stop them
+                    process_set.kill_all()
+                    shutil.rmtree(disk_dir, ignore_errors=True)
+                    raise
+        except:
+            # Nothing refers to the leased ports until the status is written
+            self._ports.release("tcp", network.forwarded_ports.values())
+            raise
+        
+        machine = _create_machine(image.users, status, self._statuses, self._ports, self._admission)
+        
+        # A restored guest has already signalled that it's ready before the
+        # snapshot was taken, so only wait for SSH
+        if snapshot is None:
+            guest_readiness_socket_path = readiness_socket_path
+        else:
+            guest_readiness_socket_path = None
+        
+        try:
+            self._wait_for_ssh(process_set, machine, image, guest_readiness_socket_path)
+            if snapshot is not None:
+                self._set_guest_clock(machine, image)
+            if directories:
+                with machine.root_shell() as root_shell:
+                    config = shareddirectories.shared_directory_config(image.operating_system_family, root_shell)
+                    config.mount(directories, self._invoker.shared_directory_mount_type)
+        except:
+            machine.destroy()
+            raise
+        
+        if pooled:
+            if self._idle_memory_size is not None and image.memory_balloon:
+                # Machines in warm pools are idle until they're claimed, so
+                # return most of their memory to the host in the meantime
+                machine.set_memory_size(min(self._idle_memory_size, image.memory_size))
+                status = self._statuses.read(identifier)
+            status.pool_state = PoolStates.ready
+            self._statuses.write(status)
+        
+        return machine
+        
+    @contextlib.contextmanager
+    def _reserve(self, identifier, memory_size, cpus):
+        with self._admission.admit(identifier, memory_size, cpus=cpus):
+            if self._placement is None:
+                yield None
+            else:
+                with self._placement.place(identifier, cpus) as host_cpus:
+                    yield host_cpus
+    
+    def _set_guest_clock(self, machine, image):
+        # A restored guest's clock carries on from when the snapshot was taken
+        if image.operating_system_family == "linux":
+            with machine.root_shell() as root_shell:
+                root_shell.run(["date", "-u", "-s", "@{0}".format(int(time.time()))])
+    
+    def _resume_snapshot_for(self, image, network, cpus, cpu_model, disk_options, directories):
+        # Restoring a snapshot requires the same set of devices as the
+        # machine that the snapshot was taken from
+        if network.has_extra_devices() or directories:
+            return None
+        elif cpus != image.cpus or cpu_model != image.cpu_model:
+            return None
+        elif disk_options["iothread"] != image.disk_options["iothread"]:
+            return None
+        else:
+            return image.resume_snapshot
+    
+    def _start_qemu(self, image, network, hardware, process_set, disk_dir, snapshot, readiness_socket_path, qmp_path):
+        if snapshot is None:
+            disks = self._invoker.create_overlays(image.disks, disk_dir)
+            self._invoker.start_process(
+                image, network, hardware, process_set,
+                disks=disks,
+                qmp_path=qmp_path,
+                readiness_socket_path=readiness_socket_path,
+            )
+        else:
+            disks = self._invoker.create_overlays(snapshot.disks, disk_dir)
+            self._invoker.start_process(
+                image, network, hardware, process_set,
+                disks=disks,
+                incoming_state_path=snapshot.state_path,
+                qmp_path=qmp_path,
+                readiness_socket_path=readiness_socket_path,
+            )
+        
+        if hardware.host_cpus is not None:
+            self._invoker.pin_vcpus(qmp_path, hardware.host_cpus)
+    
+    def build_resume_snapshot(self, image_name):
+        image = self._images.image(image_name)
+        snapshot_path = self._images.new_resume_snapshot_path(image_name)
+        disks = self._invoker.create_overlays(image.disks, snapshot_path)
+        
+        request = request_machine("peachtree-resume-snapshot", image_name)
+        network = self._networking.settings_for(image, request, self._ports)
         identifier = str(uuid.uuid4())
+        process_set = processes.start(
+            {},
+            self._statuses.process_storage_dir(identifier),
+            run_directory=self._statuses.run_directory,
+        )
+        self._statuses.create_socket_dir(identifier)
+        qmp_path = self._statuses.socket_path(identifier, "qmp")
+        readiness_socket_path = self._statuses.socket_path(identifier, "readiness")
+        hardware = Hardware(
+            cpus=image.cpus,
+            cpu_model=image.cpu_model,
+            host_cpus=None,
+            disk_options=image.disk_options,
+            shared_directories=[],
+        )
         
-        process_set = processes.start({}, self._statuses.process_storage_dir(identifier))
-        self._invoker.start_process(image, network, process_set)
+        self._invoker.start_process(
+            image, network, hardware, process_set,
+            disks=disks,
+            qmp_path=qmp_path,
+            readiness_socket_path=readiness_socket_path,
+        )
         
         status = MachineStatus(
             name=request.name,
             identifier=identifier,
-            image_name=request.image_name,
+            image_name=image_name,
             ssh_internal_port=image.ssh_internal_port,
-            # TODO: either re-couple network, or find a better way of
-            # storing network details
             forwarded_ports=network.forwarded_ports,
-            timeout=request.timeout,
+            leased_ports=network.leased_ports,
+            timeout=START_MACHINE_TIMEOUT * 2,
             start_time=time.time(),
-            process_set_run_dir=process_set.run_dir
+            process_set_run_dir=process_set.run_dir,
+            pool_state=None,
+            disk_dir=None,
+            memory_size=image.memory_size,
+            cpus=image.cpus,
+            cpu_model=image.cpu_model,
+            host_cpus=None,
+            disk_options=image.disk_options,
+            memory_target=None,
+            paused_time=None,
+            pause_extends_timeout=False,
+            timeout_extension=0,
         )
-        
         self._statuses.write(status)
-        machine = _create_machine(image.users, status, self._statuses)
+        machine = _create_machine(image.users, status, self._statuses, self._ports, self._admission)
         
         try:
-            self._wait_for_ssh(process_set, machine)
-            return machine
+            self._wait_for_ssh(process_set, machine, image, readiness_socket_path)
+            with qmp.connect(qmp_path) as monitor:
+                monitor.migrate_to_file(resume_snapshot_state_path(snapshot_path))
+            write_resume_snapshot_config(snapshot_path, image)
         except:
-            machine.destroy()
+            shutil.rmtree(snapshot_path, ignore_errors=True)
             raise
+        finally:
+            machine.destroy()
         
-    def _wait_for_ssh(self, process_set, machine):
-        def attempt_ssh_command():
-            if not process_set.all_running():
-                process_set.kill_all()
-                wait.wait_until_not(process_set.any_running, timeout=1, wait_time=0.1)
-                output = process_set.all_output()
+        self._images.set_resume_snapshot(image_name, snapshot_path)
+        return snapshot_path
+    
+    def _wait_for_ssh(self, process_set, machine, image, readiness_socket_path):
+        start_time = time.time()
+        hostname = machine.external_hostname()
+        port = machine.public_port(machine.ssh_internal_port)
+        
+        process_exited = process_set.exit_event()
+        
+        def check_process_set():
+            if process_exited.is_set():
+                process_set.kill_all(grace_period=1)
+                output = process_set.all_output(max_bytes=_max_error_output_size)
                 raise RuntimeError("Process died, output:\n{0}".format(output))
+        
+        def remaining_time():
+            return max(0, START_MACHINE_TIMEOUT - (time.time() - start_time))
+        
+        channel = readiness.readiness_channel(image.readiness_channel)
+        if channel is not None and readiness_socket_path is not None:
+            readiness.wait_until_ready(
+                channel, readiness_socket_path,
+                timeout=remaining_time(),
+                check_process=check_process_set,
+            )
+        
+        def ssh_banner_is_available():
+            check_process_set()
+            return sshready.has_ssh_banner(hostname, port)
+        
+        # Waiting for the SSH banner is much cheaper than attempting an
+        # authenticated SSH connection, so we can check more frequently
+        wait.wait_until(
+            ssh_banner_is_available,
+            timeout=remaining_time(),
+            wait_time=0.05,
+            max_wait_time=1,
+            interrupt=process_exited,
+            error_message="Timed out waiting for SSH on VM {0}".format(machine.identifier)
+        )
+        
+        def attempt_ssh_command():
+            check_process_set()
             with machine.root_shell() as shell:
                 shell.run(["true"])
             
         wait.wait_until_successful(
             attempt_ssh_command,
             errors=(spur.ssh.ConnectionError, ),
-            timeout=START_MACHINE_TIMEOUT,
-            wait_time=1
+            timeout=remaining_time(),
+            wait_time=0.1,
+            max_wait_time=1,
+            interrupt=process_exited,
         )
         
     def find_running_machine(self, identifier):
         machine = self._find_machine(identifier)
-        if machine is None:
-            return None
-        elif machine.is_running():
+        if machine is not None and machine.is_running():
             return machine
         else:
+            # The machine may have been stopped by another process
+            sshpool.shells.evict(identifier)
             return None
         
     def _find_machine(self, identifier):
+        # Pooled machines can be found so that they can be stopped, even
+        # though they're not listed
         status = self._statuses.read(identifier)
         if status is None:
             return None
         else:
             return self._machine_from_status(status)
         
-    def _machine_from_status(self, status):
+    def _machine_from_status(self, status, process_set=None):
         image = self._images.image(status.image_name)
-        return _create_machine(image.users, status, self._statuses)
+        return _create_machine(image.users, status, self._statuses, self._ports, self._admission, process_set=process_set)
     
     def list_running_machines(self):
-        statuses = self._statuses.read_all()
-        machines = map(self._machine_from_status, statuses)
-        return [machine for machine in machines if machine is not None]
+        statuses = [
+            status
+            for status in self._statuses.read_all()
+            if status.pool_state is None
+        ]
+        return [
+            self._machine_from_status(status, process_set)
+            for status, process_set, is_running in self._liveness(statuses)
+            if is_running
+        ]
     
     def list_images(self):
         return [image.name for image in self._images.all()]
     
+    def drain_warm_pools(self):
+        self._pools.drain()
+    
     def cron(self):
         self._stop_machines_past_timeout()
         self._clean_statuses()
+        self._ports.clean(self._statuses.read_all())
+        self._networking.clean()
+        self._pools.reap()
+        self._pools.refill_in_background()
+        sshpool.shells.evict_idle()
         
     def _stop_machines_past_timeout(self):
-        statuses = self._statuses.read_all()
-        for status in statuses:
-            if status.timeout is not None:
-                running_time = time.time() - status.start_time
-                if running_time > status.timeout:
-                    self._machine_from_status(status).destroy()
+        for status in self._statuses.read_expired(time.time()):
+            # Claiming a pooled machine stops it being handed out while it's
+            # stopped, and fails if it's already been handed out
+            if status.pool_state is None or self._statuses.claim(status.identifier):
+                self._machine_from_status(status).destroy()
     
     def _clean_statuses(self):
-        for status in self._statuses.read_all():
-            machine = self._machine_from_status(status)
-            if not machine.is_running():
-                self._statuses.remove(status.identifier)
+        statuses = self._statuses.read_all()
+        for status, process_set, is_running in self._liveness(statuses):
+            if is_running:
+                process_set.rotate_output()
+            else:
+                self._machine_from_status(status, process_set).destroy()
+    
+    def _liveness(self, statuses):
+        process_sets = [
+            processes.from_dir(status.process_set_run_dir, run_directory=self._statuses.run_directory)
+            for status in statuses
+        ]
+        return zip(statuses, process_sets, processes.all_running_each(process_sets))
 
 
 class QemuInvoker(object):
-    def __init__(self, command, accel_arg):
+    def __init__(self, command, accel_arg, img_command, shared_directory_backend):
         self._command = command
         self._accel_arg = accel_arg
+        self._img_command = img_command
+        self._shared_directory_backend = shared_directory_backend
+    
+    @property
+    def shared_directory_mount_type(self):
+        return self._shared_directory_backend.mount_type
+        
+    def start_process(self, image, network, hardware, process_set, disks, incoming_state_path=None, qmp_path=None, readiness_socket_path=None):
+        if incoming_state_path is None:
+            incoming_args = []
+        else:
+            incoming_args = ["-incoming", qmp.incoming_from_file_arg(incoming_state_path)]
         
-    def start_process(self, image, network, process_set):
-        disk_args = []
-        for disk in image.disks:
-            disk_args += ["-drive", "file={0},if=virtio".format(disk)]
+        if qmp_path is None:
+            qmp_args = []
+        else:
+            qmp_args = ["-qmp", "unix:{0},server,nowait".format(qmp_path)]
+        
+        channel = readiness.readiness_channel(image.readiness_channel)
+        if channel is None:
+            readiness_args = []
+        else:
+            readiness_args = readiness.qemu_args(channel, readiness_socket_path)
+        
+        if hardware.cpu_model is None:
+            cpu_args = []
+        else:
+            cpu_args = ["-cpu", hardware.cpu_model]
         
-        qemu_command = [
+        if hardware.host_cpus is None:
+            affinity_command = []
+        else:
+            # Keeping every QEMU thread on the CPUs of the machine's vCPUs
+            # means that its memory is allocated on their NUMA node
+            affinity_command = ["taskset", "-c", format_cpu_list(hardware.host_cpus)]
+        
+        # Any processes serving shared directories must be running before
+        # QEMU connects to them
+        shared_directory_args = self._shared_directory_backend.start(
+            process_set, hardware.shared_directories, image.memory_size
+        )
+        
+        if image.memory_balloon:
+            # Free page reporting lets the host reclaim memory freed by the
+            # guest without having to inflate the balloon
+            balloon_args = ["-device", "virtio-balloon-pci,id=balloon0,free-page-reporting=on"]
+        else:
+            balloon_args = []
+        
+        qemu_command = affinity_command + [
             self._command, "-machine", "accel={0}".format(self._accel_arg),
-            "-snapshot",
             "-nographic", "-serial", "none",
             "-m", str(image.memory_size),
-        ] + disk_args + network.qemu_args()
+            "-smp", str(hardware.cpus),
+        ] + cpu_args + drives.qemu_args(disks, hardware.disk_options) + network.qemu_args() + readiness_args + shared_directory_args + balloon_args + qmp_args + incoming_args
         process_set.start({"qemu": qemu_command})
+    
+    def pin_vcpus(self, qmp_path, host_cpus):
+        with qmp.connect(qmp_path) as monitor:
+            vcpus = monitor.execute("query-cpus-fast")
+        # Set the affinity of each vCPU thread directly rather than running
+        # taskset for each one
+        for vcpu in vcpus:
+            host_cpu = host_cpus[vcpu["cpu-index"] % len(host_cpus)]
+            psutil.Process(vcpu["thread-id"]).set_cpu_affinity([host_cpu])
+    
+    def create_overlays(self, backing_disks, overlay_dir):
+        overlays = [
+            overlay_path(overlay_dir, index)
+            for index in range(len(backing_disks))
+        ]
+        for backing_disk, overlay in zip(backing_disks, overlays):
+            self.create_overlay(backing_disk, overlay)
+        return overlays
+    
+    def create_overlay(self, backing_disk, overlay):
+        overlay_dir = os.path.dirname(overlay)
+        if not os.path.exists(overlay_dir):
+            os.makedirs(overlay_dir)
+        local_shell.run([
+            self._img_command, "create", "-f", "qcow2",
+            "-b", backing_disk, "-F", self._disk_format(backing_disk),
+            overlay,
+        ])
+    
+    def _disk_format(self, disk):
+        result = local_shell.run([
+            self._img_command, "info", "--output=json", disk
+        ])
+        return json.loads(result.output)["format"]
+
+
+Hardware = dictobj.data_class("Hardware", ["cpus", "cpu_model", "host_cpus", "disk_options", "shared_directories"])
 
 
 def _create_machine(*args, **kwargs):
@@ -222,28 +689,98 @@ def _create_machine(*args, **kwargs):
 
 
 class QemuMachine(object):
-    def __init__(self, users, status, statuses):
+    def __init__(self, users, status, statuses, ports, admission, process_set=None):
         self._users = users
         self.name = status.name
         self.image_name = status.image_name
         self.ssh_internal_port = status.ssh_internal_port
         self.identifier = status.identifier
-        self._process_set = processes.from_dir(status.process_set_run_dir)
+        if process_set is None:
+            process_set = processes.from_dir(
+                status.process_set_run_dir,
+                run_directory=statuses.run_directory,
+            )
+        self._process_set = process_set
         self._forwarded_ports = status.forwarded_ports
+        self._disk_dir = status.disk_dir
         self._statuses = statuses
+        self._ports = ports
+        self._admission = admission
     
     def is_running(self):
         return self._process_set.all_running()
     
+    def status(self):
+        return self._execute("query-status")["status"]
+    
+    def reset(self):
+        self._execute("system_reset")
+    
+    def pause(self, extend_timeout=False):
+        self._execute("stop")
+        status = self._statuses.read(self.identifier)
+        if status is not None and status.paused_time is None:
+            status.paused_time = time.time()
+            status.pause_extends_timeout = extend_timeout
+            self._statuses.write(status)
+    
+    def resume(self):
+        self._execute("cont")
+        status = self._statuses.read(self.identifier)
+        if status is not None and status.paused_time is not None:
+            if status.pause_extends_timeout:
+                status.timeout_extension += time.time() - status.paused_time
+            status.paused_time = None
+            status.pause_extends_timeout = False
+            self._statuses.write(status)
+    
+    def is_paused(self):
+        return self.status() == "paused"
+    
+    def current_memory_size(self):
+        return self._execute("query-balloon")["actual"] // _megabyte
+    
+    def set_memory_size(self, memory_size):
+        status = self._statuses.read(self.identifier)
+        if status is None:
+            raise RuntimeError("Machine {0} is not running".format(self.identifier))
+        if memory_size > status.memory_size:
+            raise ValueError("Machine {0} has at most {1}MB of memory".format(
+                self.identifier, status.memory_size
+            ))
+        
+        # Memory given back to the machine is committed again, so must fit
+        # within the host limits
+        with self._admission.admit_growth(status, memory_size):
+            self._execute("balloon", value=memory_size * _megabyte)
+            if memory_size == status.memory_size:
+                status.memory_target = None
+            else:
+                status.memory_target = memory_size
+            self._statuses.write(status)
+    
+    def power_down(self, timeout=60):
+        self._execute("system_powerdown")
+        self._process_set.wait_for_exit(timeout=timeout)
+        self.destroy()
+    
     def destroy(self):
+        try:
+            self._execute("quit")
+        except (socket.error, qmp.QmpError):
+            # QEMU is killed below regardless
+            pass
         self._process_set.kill_all()
         
-        wait.wait_until_not(
-            self._process_set.any_running, timeout=10, wait_time=0.1,
-            error_message="Failed to kill VM {0}".format(self.identifier)
-        )
+        if not self._process_set.wait_for_exit(timeout=0):
+            raise RuntimeError("Failed to kill VM {0}".format(self.identifier))
         
+        if self._disk_dir is not None:
+            shutil.rmtree(self._disk_dir, ignore_errors=True)
         self._statuses.remove(self.identifier)
+        # Ports shared with other machines, such as the port of the network
+        # used by start_many, are released by cron once unused
+        self._ports.release("tcp", self._forwarded_ports.values())
         
     def external_hostname(self):
         return starboard.find_local_hostname()
@@ -253,36 +790,146 @@ class QemuMachine(object):
     
     def forwarded_tcp_ports(self):
         return self._forwarded_ports
+    
+    def output(self, max_bytes=None):
+        return self._process_set.output("qemu", max_bytes=max_bytes)
+    
+    def follow_output(self, max_bytes=None):
+        return self._process_set.follow_output("qemu", max_bytes=max_bytes)
+    
+    def _execute(self, command, **arguments):
+        monitor = qmp.QmpClient(self._statuses.socket_path(self.identifier, "qmp"), timeout=_qmp_timeout)
+        with monitor:
+            monitor.connect()
+            return monitor.execute(command, **arguments)
 
 
 class UserNetworking(object):
-    def settings_for(self, image, request):
-        forwarded_ports = _generate_forwarded_ports(image, request.public_ports)
+    def settings_for(self, image, request, ports):
+        forwarded_ports = _generate_forwarded_ports(image, request.public_ports, ports)
         return UserNetworkSettings(forwarded_ports, [])
         
-    def start_network(self):
-        port = starboard.find_local_free_udp_port()
+    def start_network(self, ports):
+        port, = ports.lease("udp", 1)
         return UserNetwork(port)
+    
+    def clean(self):
+        pass
         
         
 class UserNetwork(object):
     def __init__(self, port):
         self._port = port
         
-    def settings_for(self, image, request):
-        forwarded_ports = _generate_forwarded_ports(image, request.public_ports)
+    def settings_for(self, image, request, ports):
+        forwarded_ports = _generate_forwarded_ports(image, request.public_ports, ports)
         socket_args = _generate_network_args(
             "guest-net-socket",
             "socket,mcast=230.0.0.1:{0},localaddr=127.0.0.1".format(self._port),
         )
-        return UserNetworkSettings(forwarded_ports, socket_args)
+        return UserNetworkSettings(forwarded_ports, socket_args, udp_ports=[self._port])
+
+
+class BridgeNetworking(object):
+    def __init__(self, vhost=False, bridge_helper=None, ip_command=None, unused_bridge_age=START_MACHINE_TIMEOUT * 2):
+        if bridge_helper is None:
+            bridge_helper = _default_bridge_helper
+        if ip_command is None:
+            ip_command = ["ip"]
+        self._vhost = vhost
+        self._bridge_helper = bridge_helper
+        self._ip_command = ip_command
+        self._unused_bridge_age = unused_bridge_age
+    
+    def settings_for(self, image, request, ports):
+        forwarded_ports = _generate_forwarded_ports(image, request.public_ports, ports)
+        return UserNetworkSettings(forwarded_ports, [])
+    
+    def start_network(self, ports):
+        self.clean()
+        
+        # Each set of machines has its own bridge, which isn't connected to
+        # any other interface, so sets can't see each other's traffic
+        bridge = "ptbr{0}".format(uuid.uuid4().hex[:8])
+        self._ip(["link", "add", "name", bridge, "type", "bridge"])
+        try:
+            self._ip(["link", "set", "dev", bridge, "alias", "{0} {1}".format(_bridge_alias, time.time())])
+            self._ip(["link", "set", "dev", bridge, "up"])
+        except:
+            self._remove_bridge(bridge)
+            raise
+        return BridgeNetwork(bridge, vhost=self._vhost, bridge_helper=self._bridge_helper)
+    
+    def clean(self):
+        # QEMU removes its TAP devices when it exits, so a bridge without any
+        # interfaces belongs to a set of machines that have all stopped. Newly
+        # created bridges are left alone while their machines start.
+        now = time.time()
+        for bridge, created_time, interfaces in _read_bridges():
+            if not interfaces and now - created_time > self._unused_bridge_age:
+                self._remove_bridge(bridge)
+    
+    def _remove_bridge(self, bridge):
+        self._ip(["link", "delete", bridge, "type", "bridge"], allow_error=True)
+    
+    def _ip(self, args, allow_error=False):
+        return local_shell.run(self._ip_command + args, allow_error=allow_error)
+
+
+class BridgeNetwork(object):
+    def __init__(self, bridge, vhost, bridge_helper):
+        self._bridge = bridge
+        self._vhost = vhost
+        self._bridge_helper = bridge_helper
+    
+    def settings_for(self, image, request, ports):
+        forwarded_ports = _generate_forwarded_ports(image, request.public_ports, ports)
+        # The helper creates a TAP device and adds it to the bridge, so QEMU
+        # doesn't need to run with CAP_NET_ADMIN
+        tap_netdev = "tap,helper={0} --br={1},vhost={2}".format(
+            self._bridge_helper,
+            self._bridge,
+            "on" if self._vhost else "off",
+        )
+        tap_args = _generate_network_args("guest-net-tap", tap_netdev)
+        return UserNetworkSettings(forwarded_ports, tap_args)
+
+
+_default_bridge_helper = "/usr/lib/qemu/qemu-bridge-helper"
+_bridge_alias = "peachtree"
+_sys_class_net = "/sys/class/net"
+
+
+def _read_bridges():
+    bridges = []
+    for name in os.listdir(_sys_class_net):
+        interface_dir = os.path.join(_sys_class_net, name)
+        try:
+            with open(os.path.join(interface_dir, "ifalias")) as alias_file:
+                alias = alias_file.read().split()
+            if len(alias) == 2 and alias[0] == _bridge_alias:
+                interfaces = os.listdir(os.path.join(interface_dir, "brif"))
+                bridges.append((name, float(alias[1]), interfaces))
+        except (IOError, OSError) as error:
+            # ENOENT: Interface has been removed in the interim, or isn't a
+            # bridge, so ignore
+            if error.errno != errno.ENOENT:
+                raise
+    return bridges
 
 
 class UserNetworkSettings(object):
-    def __init__(self, forwarded_ports, extra_args):
+    def __init__(self, forwarded_ports, extra_args, udp_ports=None):
         self.forwarded_ports = forwarded_ports
+        self.leased_ports = {
+            "tcp": forwarded_ports.values(),
+            "udp": udp_ports or [],
+        }
         self._extra_args = extra_args
         
+    def has_extra_devices(self):
+        return len(self._extra_args) > 0
+        
     def qemu_args(self):
         kvm_forward_ports = [
             "hostfwd=tcp::{0}-:{1}".format(host_port, guest_port)
@@ -304,7 +951,7 @@ def _generate_network_args(name, netdev):
     ]
 
     
-def _generate_forwarded_ports(image, public_ports):
+def _generate_forwarded_ports(image, public_ports, ports):
     public_ports = set([image.ssh_internal_port] + public_ports)
-    host_ports = starboard.find_local_free_tcp_ports(len(public_ports))
+    host_ports = ports.lease("tcp", len(public_ports))
     return dict(zip(public_ports, host_ports))
@@ -0,0 +1,97 @@
+import socket
+import json
+
+from .. import wait
+from .common import escape_sh
+
+
+def connect(socket_path, timeout=10):
+    client = QmpClient(socket_path)
+    wait.wait_until_successful(
+        client.connect,
+        errors=(socket.error, ),
+        timeout=timeout,
+        wait_time=0.1
+    )
+    return client
+
+
+class QmpError(RuntimeError):
+    pass
+
+
+class QmpClient(object):
+    def __init__(self, socket_path, timeout=None):
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._socket = None
+        self._socket_file = None
+    
+    def connect(self):
+        qmp_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        qmp_socket.settimeout(self._timeout)
+        try:
+            qmp_socket.connect(self._socket_path)
+        except:
+            qmp_socket.close()
+            raise
+        self._socket = qmp_socket
+        self._socket_file = qmp_socket.makefile("rb")
+        try:
+            # Greeting
+            self._read_message()
+            self.execute("qmp_capabilities")
+        except:
+            self.close()
+            raise
+    
+    def execute(self, command, **arguments):
+        message = {"execute": command}
+        if arguments:
+            message["arguments"] = arguments
+        self._socket.sendall(json.dumps(message) + "\n")
+        
+        while True:
+            response = self._read_message()
+            if "return" in response:
+                return response["return"]
+            elif "error" in response:
+                raise QmpError("{0} failed: {1}".format(
+                    command, response["error"].get("desc", response["error"])
+                ))
+    
+    def migrate_to_file(self, path, timeout=60):
+        self.execute("migrate", uri="exec:cat > {0}".format(escape_sh(path)))
+        
+        def migration_status():
+            status = self.execute("query-migrate").get("status")
+            if status == "failed":
+                raise QmpError("Migration to {0} failed".format(path))
+            return status == "completed"
+        
+        wait.wait_until(
+            migration_status, timeout=timeout, wait_time=0.1,
+            error_message="Timed out migrating to {0}".format(path)
+        )
+    
+    def close(self):
+        if self._socket is not None:
+            self._socket_file.close()
+            self._socket.close()
+            self._socket = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def _read_message(self):
+        line = self._socket_file.readline()
+        if not line:
+            raise socket.error("QMP connection closed")
+        return json.loads(line)
+
+
+def incoming_from_file_arg(path):
+    return "exec:cat {0}".format(escape_sh(path))
@@ -0,0 +1,110 @@
+import socket
+import select
+import time
+import json
+
+from .. import wait
+
+
+def readiness_channel(name):
+    if name is None:
+        return None
+    
+    channels = {
+        "virtio-serial": VirtioSerialReadiness(),
+        "guest-agent": GuestAgentReadiness(),
+    }
+    if name not in channels:
+        raise ValueError("Unknown readiness channel: {0}".format(name))
+    return channels[name]
+
+
+class VirtioSerialReadiness(object):
+    port_name = "org.peachtree.ready.0"
+    
+    def start(self, connection):
+        pass
+    
+    def on_idle(self, connection):
+        pass
+    
+    def is_ready(self, received):
+        return "READY" in (line.strip() for line in received.split("\n"))
+
+
+class GuestAgentReadiness(object):
+    port_name = "org.qemu.guest_agent.0"
+    
+    def start(self, connection):
+        self._ping(connection)
+    
+    def on_idle(self, connection):
+        # The guest agent discards anything sent before it started, so
+        # keep pinging until it responds
+        self._ping(connection)
+    
+    def is_ready(self, received):
+        for line in received.split("\n"):
+            try:
+                if "return" in json.loads(line):
+                    return True
+            except ValueError:
+                pass
+        return False
+    
+    def _ping(self, connection):
+        connection.sendall(json.dumps({"execute": "guest-ping"}) + "\n")
+
+
+def qemu_args(channel, socket_path):
+    chardev_id = "peachtree-readiness"
+    return [
+        "-chardev", "socket,id={0},path={1},server,nowait".format(chardev_id, socket_path),
+        "-device", "virtio-serial-pci",
+        "-device", "virtserialport,chardev={0},name={1}".format(chardev_id, channel.port_name),
+    ]
+
+
+def wait_until_ready(channel, socket_path, timeout, check_process, idle_time=1):
+    deadline = time.time() + timeout
+    
+    def connect():
+        check_process()
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(socket_path)
+        except:
+            connection.close()
+            raise
+        return connection
+    
+    connection = wait.wait_until_successful(
+        connect,
+        errors=(socket.error, ),
+        timeout=timeout,
+        wait_time=0.05,
+        max_wait_time=0.5
+    )
+    
+    try:
+        channel.start(connection)
+        received = ""
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RuntimeError("Timed out waiting for guest to signal readiness")
+            
+            readable, _, _ = select.select([connection], [], [], min(remaining, idle_time))
+            if readable:
+                data = connection.recv(4096)
+                if not data:
+                    check_process()
+                    raise RuntimeError("Readiness channel was closed by QEMU")
+                received += data
+                if channel.is_ready(received):
+                    return
+            else:
+                check_process()
+                channel.on_idle(connection)
+    finally:
+        connection.close()
@@ -0,0 +1,212 @@
+import os
+
+import spur
+
+from .. import dictobj
+from .. import wait
+from .common import escape_qemu_option
+
+
+SharedDirectory = dictobj.data_class("SharedDirectory", [
+    "host_path",
+    "guest_path",
+    "tag",
+    "socket_path",
+])
+
+
+_max_error_output_size = 64 * 1024
+
+local_shell = spur.LocalShell()
+
+_virtiofsd_paths = [
+    "/usr/libexec/virtiofsd",
+    "/usr/lib/qemu/virtiofsd",
+    "/usr/lib/virtiofsd",
+]
+
+
+def shared_directories(directory_pairs, socket_path):
+    directories = []
+    for index, (host_path, guest_path) in enumerate(directory_pairs or []):
+        if not os.path.isdir(host_path):
+            raise ValueError("Shared directory does not exist: {0}".format(host_path))
+        if not guest_path.startswith("/"):
+            raise ValueError("Guest path of shared directory must be absolute: {0}".format(guest_path))
+        tag = "peachtree{0}".format(index)
+        directories.append(SharedDirectory(
+            host_path=os.path.abspath(host_path),
+            guest_path=guest_path,
+            tag=tag,
+            socket_path=socket_path(tag),
+        ))
+    return directories
+
+
+def shared_directory_backend(name=None):
+    # Finding virtiofsd runs it, so is put off until a machine with shared
+    # directories is started
+    if name is None:
+        return _LazyBackend(_default_backend)
+    elif name == "virtiofs":
+        return _LazyBackend(_virtiofs_backend)
+    elif name == "9p":
+        return NinePBackend()
+    else:
+        raise ValueError("Unknown shared directory backend: {0}".format(name))
+
+
+def _default_backend():
+    virtiofsd = find_virtiofsd()
+    if virtiofsd is None:
+        return NinePBackend()
+    else:
+        return VirtiofsBackend(virtiofsd)
+
+
+def _virtiofs_backend():
+    virtiofsd = find_virtiofsd()
+    if virtiofsd is None:
+        raise RuntimeError("Could not find virtiofsd")
+    return VirtiofsBackend(virtiofsd)
+
+
+def find_virtiofsd():
+    for path in _virtiofsd_paths + _paths_on_path("virtiofsd"):
+        if os.access(path, os.X_OK) and _is_supported_virtiofsd(path):
+            return path
+    return None
+
+
+def _is_supported_virtiofsd(path):
+    # The virtiofsd previously shipped with QEMU takes "-o source=DIR"
+    # rather than the options of the current virtiofsd, so ignore it
+    result = local_shell.run([path, "--help"], allow_error=True)
+    return "--shared-dir" in result.output + result.stderr_output
+
+
+def _paths_on_path(name):
+    return [
+        os.path.join(directory, name)
+        for directory in os.environ.get("PATH", "").split(os.pathsep)
+        if directory
+    ]
+
+
+class _LazyBackend(object):
+    def __init__(self, create_backend):
+        self._create_backend = create_backend
+        self._backend = None
+    
+    @property
+    def mount_type(self):
+        return self._get_backend().mount_type
+    
+    def start(self, process_set, directories, memory_size):
+        if not directories:
+            return []
+        return self._get_backend().start(process_set, directories, memory_size)
+    
+    def _get_backend(self):
+        if self._backend is None:
+            self._backend = self._create_backend()
+        return self._backend
+
+
+class VirtiofsBackend(object):
+    mount_type = "virtiofs"
+    
+    def __init__(self, virtiofsd):
+        self._virtiofsd = virtiofsd
+    
+    def start(self, process_set, directories, memory_size):
+        if not directories:
+            return []
+        
+        commands = dict(
+            ("virtiofsd-{0}".format(directory.tag), self._virtiofsd_command(directory))
+            for directory in directories
+        )
+        process_set.start(commands)
+        for directory in directories:
+            # Stop waiting as soon as virtiofsd exits, for instance if it
+            # rejects its arguments
+            wait.wait_until(
+                lambda: os.path.exists(directory.socket_path) or not process_set.all_running(),
+                timeout=10, wait_time=0.05,
+                error_message="virtiofsd did not create {0}".format(directory.socket_path),
+            )
+            if not os.path.exists(directory.socket_path):
+                output = process_set.all_output(max_bytes=_max_error_output_size)
+                raise RuntimeError("virtiofsd died, output:\n{0}".format(output))
+        
+        # vhost-user devices require guest memory to be shared with virtiofsd
+        args = [
+            "-object", "memory-backend-memfd,id=shared-mem,size={0}M,share=on".format(memory_size),
+            "-numa", "node,memdev=shared-mem",
+        ]
+        for directory in directories:
+            args += [
+                "-chardev", "socket,id={0},path={1}".format(directory.tag, escape_qemu_option(directory.socket_path)),
+                "-device", "vhost-user-fs-pci,chardev={0},tag={0}".format(directory.tag),
+            ]
+        return args
+    
+    def _virtiofsd_command(self, directory):
+        command = [
+            self._virtiofsd,
+            "--socket-path={0}".format(directory.socket_path),
+            "--shared-dir={0}".format(directory.host_path),
+        ]
+        if os.geteuid() != 0:
+            # Sandboxing virtiofsd in namespaces requires root
+            command.append("--sandbox=none")
+        return command
+
+
+class NinePBackend(object):
+    mount_type = "9p"
+    
+    def start(self, process_set, directories, memory_size):
+        args = []
+        for directory in directories:
+            args += [
+                "-virtfs",
+                "local,path={0},mount_tag={1},security_model=none,id={1}".format(escape_qemu_option(directory.host_path), directory.tag),
+            ]
+        return args
+
+
+def shared_directory_config(operating_system_family, shell):
+    configs = {
+        "linux": LinuxSharedDirectoryConfig(),
+    }
+    config = configs.get(operating_system_family, None)
+    if config is None:
+        raise ValueError("Shared directories are not supported on {0}".format(operating_system_family))
+    return SharedDirectoryConfigurer(config, shell)
+
+
+class SharedDirectoryConfigurer(object):
+    def __init__(self, config, shell):
+        self._config = config
+        self._shell = shell
+    
+    def mount(self, directories, mount_type):
+        for directory in directories:
+            self._config.mount(self._shell, directory, mount_type)
+
+
+class LinuxSharedDirectoryConfig(object):
+    _mount_options = {
+        "virtiofs": [],
+        "9p": ["-o", "trans=virtio,version=9p2000.L,msize=262144"],
+    }
+    
+    def mount(self, root_shell, directory, mount_type):
+        root_shell.run(["mkdir", "-p", directory.guest_path])
+        root_shell.run(
+            ["mount", "-t", mount_type] +
+            self._mount_options[mount_type] +
+            [directory.tag, directory.guest_path]
+        )
@@ -0,0 +1,207 @@
+import os
+import json
+import sqlite3
+import threading
+import contextlib
+
+from .. import processes
+from .statuses import Statuses, status_to_dict, status_from_dict, expiry_time, running
+
+
+_schema = [
+    """
+    CREATE TABLE IF NOT EXISTS statuses (
+        identifier TEXT PRIMARY KEY,
+        image_name TEXT NOT NULL,
+        expiry_time REAL,
+        claimed INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS statuses_image_name ON statuses (image_name)",
+    "CREATE INDEX IF NOT EXISTS statuses_expiry_time ON statuses (expiry_time)",
+    """
+    CREATE TABLE IF NOT EXISTS processes (
+        run_dir TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        pid INTEGER,
+        start_time REAL,
+        PRIMARY KEY (run_dir, name)
+    )
+    """,
+]
+
+
+class SqliteStatuses(object):
+    def __init__(self, database_path, status_dir, overlay_dir=None, images=None):
+        self._database = Database(database_path)
+        self._images = images
+        # Disks, sockets and process output are still stored on the
+        # filesystem
+        self._paths = Statuses(status_dir, overlay_dir=overlay_dir)
+    
+    def remove(self, identifier):
+        with self._database.transaction() as cursor:
+            cursor.execute("SELECT status FROM statuses WHERE identifier = ?", (identifier, ))
+            row = cursor.fetchone()
+            if row is not None:
+                run_dir = json.loads(row[0])["processSetRunDir"]
+                cursor.execute("DELETE FROM processes WHERE run_dir = ?", (run_dir, ))
+            cursor.execute("DELETE FROM statuses WHERE identifier = ?", (identifier, ))
+        self._paths.remove_sockets(identifier)
+    
+    def write(self, status):
+        status_expiry_time = expiry_time(status)
+        
+        with self._database.transaction() as cursor:
+            cursor.execute(
+                "UPDATE statuses SET image_name = ?, expiry_time = ?, status = ? WHERE identifier = ?",
+                (status.image_name, status_expiry_time, json.dumps(status_to_dict(status)), status.identifier)
+            )
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "INSERT INTO statuses (identifier, image_name, expiry_time, status) VALUES (?, ?, ?, ?)",
+                    (status.identifier, status.image_name, status_expiry_time, json.dumps(status_to_dict(status)))
+                )
+    
+    def claim(self, identifier):
+        with self._database.transaction() as cursor:
+            cursor.execute(
+                "UPDATE statuses SET claimed = 1 WHERE identifier = ? AND claimed = 0",
+                (identifier, )
+            )
+            return cursor.rowcount == 1
+    
+    def is_claimed(self, identifier):
+        rows = self._database.query(
+            "SELECT claimed FROM statuses WHERE identifier = ?", (identifier, )
+        )
+        return bool(rows and rows[0][0])
+    
+    def disk_dir(self, identifier):
+        return self._paths.disk_dir(identifier)
+    
+    def socket_path(self, identifier, name):
+        return self._paths.socket_path(identifier, name)
+    
+    def create_socket_dir(self, identifier):
+        self._paths.create_socket_dir(identifier)
+    
+    def process_storage_dir(self, identifier):
+        return self._paths.process_storage_dir(identifier)
+    
+    def run_directory(self, run_dir):
+        return SqliteRunDirectory(self._database, run_dir)
+    
+    def read(self, identifier):
+        statuses = self._read_where("identifier = ?", (identifier, ))
+        if statuses:
+            return statuses[0]
+        else:
+            return None
+    
+    def read_all(self):
+        return self._read_where("1", ())
+    
+    def read_by_image(self, image_name):
+        return self._read_where("image_name = ?", (image_name, ))
+    
+    def read_expired(self, now):
+        return self._read_where("expiry_time < ?", (now, ))
+    
+    def read_running(self):
+        return running(self.read_all(), self.run_directory)
+    
+    def _read_where(self, condition, parameters):
+        rows = self._database.query(
+            "SELECT status FROM statuses WHERE {0}".format(condition),
+            parameters
+        )
+        return [status_from_dict(json.loads(row[0]), self._images) for row in rows]
+
+
+class SqliteRunDirectory(object):
+    def __init__(self, database, run_dir):
+        self._database = database
+        self._run_dir = run_dir
+    
+    def append_names(self, names):
+        with self._database.transaction() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM processes WHERE run_dir = ?", (self._run_dir, ))
+            count, = cursor.fetchone()
+            cursor.executemany(
+                "INSERT INTO processes (run_dir, position, name) VALUES (?, ?, ?)",
+                [(self._run_dir, count + index, name) for index, name in enumerate(names)]
+            )
+    
+    def read_names(self):
+        rows = self._database.query(
+            "SELECT name FROM processes WHERE run_dir = ? ORDER BY position",
+            (self._run_dir, )
+        )
+        return [row[0] for row in rows]
+    
+    def write_process_info(self, name, process_info):
+        with self._database.transaction() as cursor:
+            cursor.execute(
+                "UPDATE processes SET pid = ?, start_time = ? WHERE run_dir = ? AND name = ?",
+                (process_info.pid, process_info.start_time, self._run_dir, name)
+            )
+    
+    def read_process_info(self, name):
+        rows = self._database.query(
+            "SELECT pid, start_time FROM processes WHERE run_dir = ? AND name = ?",
+            (self._run_dir, name)
+        )
+        pid, start_time = rows[0]
+        return processes.ProcessInfo(pid, start_time)
+    
+    def output_path(self, name):
+        return processes.RunDirectory(self._run_dir).output_path(name)
+
+
+class Database(object):
+    def __init__(self, path):
+        self._path = path
+        self._connections = threading.local()
+        
+        with self.transaction() as cursor:
+            for statement in _schema:
+                cursor.execute(statement)
+    
+    @contextlib.contextmanager
+    def transaction(self):
+        connection = self._connection()
+        cursor = connection.cursor()
+        # Take the write lock immediately so that reads within the
+        # transaction are consistent with its writes
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield cursor
+            cursor.execute("COMMIT")
+        except:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.close()
+    
+    def query(self, sql, parameters):
+        cursor = self._connection().cursor()
+        try:
+            cursor.execute(sql, parameters)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._connections, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self._path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._connections.connection = connection
+        return connection
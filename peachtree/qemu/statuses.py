@@ -1,13 +1,36 @@
 import os
 import json
 import errno
+import copy
+import threading
+import time
+import tempfile
+import hashlib
+import shutil
+import stat
 
 from .. import dictobj
+from .. import processes
+from . import drives
+
+
+# Changes to the status directory within this interval of reading it may
+# share its mtime on filesystems with coarse timestamps
+_racy_interval = 2
+
+# sun_path is 108 bytes, including the terminating null byte, which leaves
+# room for socket names of up to 32 characters in directories of up to 75
+_max_socket_dir_length = 107 - 32
 
 
 class Statuses(object):
-    def __init__(self, status_dir):
+    def __init__(self, status_dir, overlay_dir=None, images=None):
         self._status_dir = status_dir
+        self._overlay_dir = overlay_dir
+        self._images = images
+        self._lock = threading.Lock()
+        self._index = _StatusIndex()
+        self._index_mtime = None
         
     def remove(self, identifier):
         try:
@@ -16,15 +39,143 @@ class Statuses(object):
             # ENOENT: Machine has been shut down in the interim, so ignore
             if error.errno != errno.ENOENT:
                 raise
+        with self._lock:
+            self._index.remove(identifier)
+        self._touch_status_dir()
+        self.remove_sockets(identifier)
     
     def write(self, status):
-        status_json = dictobj.obj_to_dict(status)
-        self._write_json(status.identifier, status_json)
+        status_json = status_to_dict(status)
+        file_key = self._write_json(status.identifier, status_json)
+        with self._lock:
+            self._index.add(file_key, copy.copy(status))
+        self._touch_status_dir()
+    
+    def claim(self, identifier):
+        try:
+            os.mkdir(self._claim_path(identifier))
+            return True
+        except OSError as error:
+            # EEXIST: Machine has already been claimed by another caller
+            # ENOENT: Machine has been shut down in the interim
+            if error.errno in [errno.EEXIST, errno.ENOENT]:
+                return False
+            else:
+                raise
+    
+    def is_claimed(self, identifier):
+        return os.path.exists(self._claim_path(identifier))
+    
+    def disk_dir(self, identifier):
+        if self._overlay_dir is None:
+            return os.path.join(self._status_dir_for_identifier(identifier), "disks")
+        else:
+            return os.path.join(self._overlay_dir, identifier)
+    
+    def socket_path(self, identifier, name):
+        return os.path.join(self._socket_dir(identifier), "{0}.sock".format(name))
+    
+    def create_socket_dir(self, identifier):
+        socket_dir = self._socket_dir(identifier)
+        if socket_dir == self._short_socket_dir(identifier):
+            _mkdir_private(os.path.dirname(socket_dir))
+        _mkdir_p(socket_dir)
+    
+    def remove_sockets(self, identifier):
+        shutil.rmtree(self._short_socket_dir(identifier), ignore_errors=True)
+    
+    def _socket_dir(self, identifier):
+        status_dir = self._status_dir_for_identifier(identifier)
+        if len(status_dir) <= _max_socket_dir_length:
+            return status_dir
+        else:
+            return self._short_socket_dir(identifier)
+    
+    def _short_socket_dir(self, identifier):
+        # Used when the status directory is too deep for socket paths. The
+        # path must be the same in every process sharing the status
+        # directory, so doesn't depend on the environment
+        status_dir_hash = hashlib.sha1(os.path.abspath(self._status_dir)).hexdigest()[:12]
+        return os.path.join("/tmp", "peachtree-{0}".format(status_dir_hash), identifier)
     
     def process_storage_dir(self, identifier):
         return os.path.join(self._status_dir_for_identifier(identifier), "processes")
     
+    def run_directory(self, run_dir):
+        return processes.RunDirectory(run_dir)
+    
     def read(self, identifier):
+        with self._lock:
+            self._refresh_index()
+            return copy.copy(self._index.get(identifier))
+                        
+    def read_all(self):
+        with self._lock:
+            self._refresh_index()
+            return map(copy.copy, self._index.all())
+    
+    def read_by_image(self, image_name):
+        with self._lock:
+            self._refresh_index()
+            return map(copy.copy, self._index.by_image(image_name))
+    
+    def read_expired(self, now):
+        return [
+            status
+            for status in self.read_all()
+            if _has_expired(status, now)
+        ]
+    
+    def read_running(self):
+        return running(self.read_all(), self.run_directory)
+    
+    def _refresh_index(self):
+        # Statuses may be written by other processes, which touch the status
+        # directory after each change
+        try:
+            mtime = os.stat(self._status_dir).st_mtime
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                self._index = _StatusIndex()
+                self._index_mtime = None
+                return
+            else:
+                raise
+        
+        if mtime == self._index_mtime:
+            return
+        
+        index = _StatusIndex()
+        for identifier in os.listdir(self._status_dir):
+            file_key = self._file_key(identifier)
+            if file_key is not None:
+                status = self._index.get_if_unchanged(identifier, file_key)
+                if status is None:
+                    status = self._read_file(identifier)
+                if status is not None:
+                    index.add(file_key, status)
+        
+        self._index = index
+        if time.time() - mtime > _racy_interval:
+            self._index_mtime = mtime
+        else:
+            self._index_mtime = None
+    
+    def _file_key(self, identifier):
+        try:
+            stat = os.stat(self._status_path(identifier))
+        except OSError as error:
+            # ENOENT: Machine has been shut down in the interim, so ignore
+            # ENOTDIR: Not a status directory
+            if error.errno in [errno.ENOENT, errno.ENOTDIR]:
+                return None
+            else:
+                raise
+        # Statuses are written by replacing the file, so a changed status
+        # has a different inode
+        return (stat.st_ino, stat.st_mtime, stat.st_size)
+    
+    def _read_file(self, identifier):
         try:
             status_dict = self._read_json(identifier)
         except IOError as error:
@@ -34,24 +185,21 @@ class Statuses(object):
             else:
                 raise
         
-        status_dict["forwardedPorts"] = dict(
-            (int(guest_port), host_port)
-            for guest_port, host_port
-            in status_dict["forwardedPorts"].iteritems()
-        )
-        status = dictobj.dict_to_obj(status_dict, MachineStatus)
-        return status
-                        
-    def read_all(self):
-        if not os.path.exists(self._status_dir):
-            return []
-        identifiers = os.listdir(self._status_dir)
-        statuses = map(self.read, identifiers)
-        return filter(lambda status: status is not None, statuses)
+        return status_from_dict(status_dict, self._images)
+    
+    def _touch_status_dir(self):
+        try:
+            os.utime(self._status_dir, None)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
     
     def _status_path(self, identifier):
         return os.path.join(self._status_dir_for_identifier(identifier), "status.json")
         
+    def _claim_path(self, identifier):
+        return os.path.join(self._status_dir_for_identifier(identifier), "claimed")
+        
     def _status_dir_for_identifier(self, identifier):
         return os.path.join(self._status_dir, identifier)
 
@@ -64,9 +212,55 @@ class Statuses(object):
         status_path = self._status_path(identifier)
         
         _mkdir_p(os.path.dirname(status_path))
-            
-        with open(status_path, "w") as status_file:
-            json.dump(data, status_file)
+        
+        # Replace the status atomically so that readers never see a
+        # partially written status
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(status_path), prefix=".status-")
+        try:
+            with os.fdopen(fd, "w") as status_file:
+                json.dump(data, status_file)
+            os.rename(temp_path, status_path)
+        except:
+            os.remove(temp_path)
+            raise
+        return self._file_key(identifier)
+
+
+class _StatusIndex(object):
+    def __init__(self):
+        self._statuses = {}
+        self._file_keys = {}
+        self._identifiers_by_image = {}
+    
+    def add(self, file_key, status):
+        self.remove(status.identifier)
+        self._statuses[status.identifier] = status
+        self._file_keys[status.identifier] = file_key
+        self._identifiers_by_image.setdefault(status.image_name, set()).add(status.identifier)
+    
+    def remove(self, identifier):
+        status = self._statuses.pop(identifier, None)
+        self._file_keys.pop(identifier, None)
+        if status is not None:
+            self._identifiers_by_image[status.image_name].discard(identifier)
+    
+    def get(self, identifier):
+        return self._statuses.get(identifier, None)
+    
+    def get_if_unchanged(self, identifier, file_key):
+        if self._file_keys.get(identifier, None) == file_key:
+            return self._statuses[identifier]
+        else:
+            return None
+    
+    def all(self):
+        return self._statuses.values()
+    
+    def by_image(self, image_name):
+        return [
+            self._statuses[identifier]
+            for identifier in self._identifiers_by_image.get(image_name, ())
+        ]
 
 
 MachineStatus = dictobj.data_class("MachineStatus",
@@ -76,16 +270,120 @@ MachineStatus = dictobj.data_class("MachineStatus",
         "image_name",
         "ssh_internal_port",
         "forwarded_ports",
+        "leased_ports",
         "start_time",
         "timeout",
         "process_set_run_dir",
+        "pool_state",
+        "disk_dir",
+        "memory_size",
+        "cpus",
+        "cpu_model",
+        "host_cpus",
+        "disk_options",
+        "memory_target",
+        "paused_time",
+        "pause_extends_timeout",
+        "timeout_extension",
     ]
 )
 
 
+def expiry_time(status):
+    if status.timeout is None:
+        return None
+    elif status.paused_time is not None and status.pause_extends_timeout:
+        return None
+    else:
+        return status.start_time + status.timeout + status.timeout_extension
+
+
+def _has_expired(status, now):
+    status_expiry_time = expiry_time(status)
+    return status_expiry_time is not None and now > status_expiry_time
+
+
+def running(statuses, run_directory):
+    # Statuses of machines that have died remain until they're cleaned by cron
+    process_sets = [
+        processes.from_dir(status.process_set_run_dir, run_directory=run_directory)
+        for status in statuses
+    ]
+    return [
+        status
+        for status, is_running in zip(statuses, processes.all_running_each(process_sets))
+        if is_running
+    ]
+
+
+def status_to_dict(status):
+    return dictobj.obj_to_dict(status)
+
+
+def status_from_dict(status_dict, images=None):
+    status_dict["forwardedPorts"] = dict(
+        (int(guest_port), host_port)
+        for guest_port, host_port
+        in status_dict["forwardedPorts"].iteritems()
+    )
+    
+    # Statuses written by earlier versions of peachtree lack later fields
+    if "memorySize" not in status_dict or "cpus" not in status_dict:
+        memory_size, cpus = _image_hardware(images, status_dict["imageName"])
+        status_dict.setdefault("memorySize", memory_size)
+        status_dict.setdefault("cpus", cpus)
+    status_dict.setdefault("leasedPorts", {
+        "tcp": status_dict["forwardedPorts"].values(),
+        "udp": [],
+    })
+    status_dict.setdefault("diskOptions", drives.disk_options(None))
+    for key, value in _status_defaults.iteritems():
+        status_dict.setdefault(key, value)
+    
+    return dictobj.dict_to_obj(status_dict, MachineStatus)
+
+
+_status_defaults = {
+    "poolState": None,
+    "diskDir": None,
+    "cpuModel": None,
+    "hostCpus": None,
+    "memoryTarget": None,
+    "pausedTime": None,
+    "pauseExtendsTimeout": False,
+    "timeoutExtension": 0,
+}
+
+
+def _image_hardware(images, image_name):
+    if images is not None:
+        try:
+            image = images.image(image_name)
+            return image.memory_size, image.cpus
+        except (IOError, OSError) as error:
+            # ENOENT: Image has been removed since the machine was started
+            if error.errno != errno.ENOENT:
+                raise
+    # Defaults used by images without memory or cpus in image.json
+    return 512, 1
+
+
 def _mkdir_p(path):
     try:
         os.makedirs(path)
     except OSError as error:
         if not (error.errno == errno.EEXIST and os.path.isdir(path)):
             raise
+
+
+def _mkdir_private(path):
+    try:
+        os.mkdir(path, 0700)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
+    
+    # The path is predictable, so may have been created by another user
+    path_stat = os.lstat(path)
+    if not stat.S_ISDIR(path_stat.st_mode) or path_stat.st_uid != os.getuid() or path_stat.st_mode & 0077:
+        raise RuntimeError("{0} must be a directory accessible only by the current user".format(path))
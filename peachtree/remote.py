@@ -1,12 +1,15 @@
 import requests
 import urllib
 import json
+import time
 
 from .machines import MachineWrapper, MachineSet
 from . import dictobj
 from .users import User
 from .request import request_machine, MachineRequest
 from .common import START_MACHINE_TIMEOUT
+from .jobs import JobStates
+from .qemu.admission import AdmissionError
 
 
 def remote_provider(url=None, hostname=None, port=None):
@@ -92,31 +95,84 @@ class RemoteMachine(object):
     def restart(self):
         return self._api.restart(self.identifier)
     
+    def power_down(self):
+        self._api.power_down(self.identifier)
+    
+    def pause(self, extend_timeout=False):
+        self._api.pause(self.identifier, extend_timeout=extend_timeout)
+    
+    def resume(self):
+        self._api.resume(self.identifier)
+    
+    def is_paused(self):
+        return self._api.is_paused(self.identifier)
+    
+    def current_memory_size(self):
+        return self._api.current_memory_size(self.identifier)
+    
+    def set_memory_size(self, memory_size):
+        self._api.set_memory_size(self.identifier, memory_size)
+    
     def destroy(self):
         self._api.destroy(self.identifier)
     
+    def output(self, max_bytes=None):
+        return "".join(self._api.output(self.identifier, max_bytes=max_bytes, follow=False))
+    
+    def follow_output(self, max_bytes=None):
+        return self._api.output(self.identifier, max_bytes=max_bytes, follow=True)
+    
     def __repr__(self):
         return "RemoteMachine {0}".format(self.identifier)
 
 
+# Errors from failed jobs that are raised with the same type by the client
+_job_error_types = dict(
+    (error_type.__name__, error_type)
+    for error_type in [AdmissionError, ValueError]
+)
+
+
 class RemoteApi(object):
     _action_timeout = START_MACHINE_TIMEOUT + 30
     _info_timeout = 10
+    _job_poll_time = 20
     
     def __init__(self, base_url):
         self._base_url = base_url
         
     def start(self, request):
-        return self._action(
-            "machines",
-            data=dictobj.obj_to_dict(request),
-        )
+        return self._run_job(data=dictobj.obj_to_dict(request))
         
     def start_many(self, requests):
-        return self._action(
-            "machines",
-            data=map(dictobj.obj_to_dict, requests),
-        )
+        return self._run_job(data=map(dictobj.obj_to_dict, requests))
+    
+    def _run_job(self, data):
+        response = self._action("jobs", data=data)
+        job_id = response["jobId"]
+        job_path = "jobs/{0}".format(urllib.quote(job_id))
+        
+        start_time = time.time()
+        while True:
+            # The server holds the request open until the job finishes, or
+            # until the wait time has elapsed
+            job = self._request(
+                "GET",
+                job_path,
+                timeout=self._info_timeout + self._job_poll_time,
+                data={"wait": self._job_poll_time},
+            )
+            if job is None:
+                raise RuntimeError("Job {0} not found".format(job_id))
+            elif job["state"] == JobStates.succeeded:
+                return job["result"]
+            elif job["state"] == JobStates.failed:
+                error_type = _job_error_types.get(job.get("errorType"), RuntimeError)
+                raise error_type("Job {0} failed: {1}".format(job_id, job["error"]))
+            elif time.time() - start_time > self._action_timeout:
+                # Cancelling the job destroys any machines it goes on to start
+                self._action("{0}/cancel".format(job_path))
+                raise RuntimeError("Timed out waiting for job {0}".format(job_id))
         
     def running_machine(self, identifier):
         return self._info(self._machine_path(identifier))
@@ -130,12 +186,52 @@ class RemoteApi(object):
         
     def restart(self, identifier):
         self._action(self._machine_path(identifier, "restart"))
+    
+    def power_down(self, identifier):
+        self._action(self._machine_path(identifier, "power-down"))
+    
+    def pause(self, identifier, extend_timeout):
+        self._action(self._machine_path(identifier, "pause"), data={"extendTimeout": extend_timeout})
+    
+    def resume(self, identifier):
+        self._action(self._machine_path(identifier, "resume"))
+    
+    def is_paused(self, identifier):
+        response = self._info(self._machine_path(identifier, "is-paused"))
+        return response["isPaused"]
+    
+    def current_memory_size(self, identifier):
+        response = self._info(self._machine_path(identifier, "memory"))
+        return response["memorySize"]
+    
+    def set_memory_size(self, identifier, memory_size):
+        self._action(self._machine_path(identifier, "memory"), data={"memorySize": memory_size})
         
     def destroy(self, identifier):
         self._action(self._machine_path(identifier, "destroy"))
 
     def list_images(self):
         return self._info("images")
+    
+    def output(self, identifier, max_bytes, follow):
+        response = self._send(
+            "GET",
+            self._machine_path(identifier, "output"),
+            # Following output continues for as long as the machine is
+            # running, and the machine may write nothing for any length of
+            # time, so never time out
+            timeout=self._info_timeout if not follow else None,
+            data={"maxBytes": max_bytes, "follow": follow},
+            stream=True,
+        )
+        if response.status_code == 404:
+            return iter([])
+        elif follow:
+            # Reading a larger chunk blocks until the whole chunk has been
+            # received, which could be long after the output was written
+            return response.iter_content(chunk_size=1)
+        else:
+            return response.iter_content(chunk_size=4096)
 
     def _action(self, *args, **kwargs):
         return self._request(
@@ -146,16 +242,20 @@ class RemoteApi(object):
             "GET", *args, timeout=self._info_timeout, **kwargs)
 
     def _request(self, method, path, timeout, data=None):
+        return self._send(method, path, timeout, data=data).json()
+    
+    def _send(self, method, path, timeout, data=None, stream=False):
         response = requests.request(
             method,
             self._url(path),
             data=json.dumps(data),
             headers={"Content-Type": "application/json"},
-            timeout=timeout
+            timeout=timeout,
+            stream=stream,
         )
-        if response.status_code not in [200, 404]:
+        if response.status_code not in [200, 202, 404]:
             raise RuntimeError("Got response: {0}", response)
-        return response.json()
+        return response
         
 
     def _url(self, path):
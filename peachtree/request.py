@@ -1,13 +1,22 @@
 from . import dictobj
 
 
-def request_machine(name, image_name, public_ports=None, timeout=None):
+def request_machine(name, image_name, public_ports=None, timeout=None, cpus=None, cpu_model=None, disk_options=None, shared_directories=None):
     if public_ports is None:
         public_ports = []
-    return MachineRequest(name, image_name, public_ports, timeout)
+    if shared_directories is None:
+        shared_directories = []
+    return MachineRequest(name, image_name, public_ports, timeout, cpus, cpu_model, disk_options, shared_directories)
+
+
+def request_from_dict(request_dict):
+    # Clients of earlier versions of peachtree omit fields added since
+    request_json = dictobj.obj_to_dict(request_machine(name=None, image_name=None))
+    request_json.update(request_dict)
+    return dictobj.dict_to_obj(request_json, MachineRequest)
 
 
 MachineRequest = dictobj.data_class(
     "MachineRequest",
-    ["name", "image_name", "public_ports", "timeout"]
+    ["name", "image_name", "public_ports", "timeout", "cpus", "cpu_model", "disk_options", "shared_directories"]
 )
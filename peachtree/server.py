@@ -6,15 +6,18 @@ from wsgiref.simple_server import make_server, WSGIServer
 from pyramid.config import Configurator
 from pyramid.response import Response
 
-from . import dictobj
-from .request import MachineRequest
+from .request import request_from_dict
 from . import machine_description
+from .jobs import Jobs
 
 
 _default_timeout = 60 * 60
+_max_job_wait = 30
 
 
 def start_server(port, provider):
+    jobs = Jobs()
+    
     def http_post(func):
         return view({"POST": func})
         
@@ -47,18 +50,52 @@ def start_server(port, provider):
     def not_found(result):
         return 404, result
         
+    def accepted(result):
+        return 202, result
+        
     def start(body):
+        return success(start_machines(body))
+    
+    def start_machines(body):
         if isinstance(body, list):
-            machine_requests = [
-                dictobj.dict_to_obj(request_dict, MachineRequest)
-                for request_dict in body
-            ]
+            machine_requests = map(request_from_dict, body)
             machine_set = provider.start_many(machine_requests)
-            return success(map(_describe_machine, machine_set))
+            return map(_describe_machine, machine_set)
         else:
-            machine_request = dictobj.dict_to_obj(body, MachineRequest)
+            machine_request = request_from_dict(body)
             machine = provider.start(machine_request)
-            return success(_describe_machine(machine))
+            return _describe_machine(machine)
+    
+    def destroy_machines(descriptions):
+        if not isinstance(descriptions, list):
+            descriptions = [descriptions]
+        for description in descriptions:
+            machine = provider.find_running_machine(description["identifier"])
+            if machine is not None:
+                machine.destroy()
+    
+    @http_post
+    def start_job(body):
+        # Machines started by a job that's cancelled, such as when the client
+        # times out waiting for it, are destroyed
+        job_id = jobs.start(lambda: start_machines(body), on_cancel=destroy_machines)
+        return accepted({"jobId": job_id})
+    
+    @http_post
+    def cancel_job(body, identifier):
+        if jobs.cancel(identifier):
+            return success({"status": "OK"})
+        else:
+            return not_found(None)
+    
+    @http_get
+    def job(body, identifier):
+        wait = min((body or {}).get("wait", 0), _max_job_wait)
+        job = jobs.wait(identifier, timeout=wait)
+        if job is None:
+            return not_found(None)
+        else:
+            return success(job)
             
     def running_machines(post):
         machines = provider.list_running_machines()
@@ -92,6 +129,54 @@ def start_server(port, provider):
             machine.restart()
             return success({"status": "OK"})
         
+    @http_post
+    def power_down(post, identifier):
+        machine = provider.find_running_machine(identifier)
+        if machine is None:
+            return not_found(None)
+        else:
+            machine.power_down()
+            return success({"status": "OK"})
+        
+    @http_post
+    def pause(post, identifier):
+        machine = provider.find_running_machine(identifier)
+        if machine is None:
+            return not_found(None)
+        else:
+            machine.pause(extend_timeout=(post or {}).get("extendTimeout", False))
+            return success({"status": "OK"})
+        
+    @http_post
+    def resume(post, identifier):
+        machine = provider.find_running_machine(identifier)
+        if machine is None:
+            return not_found(None)
+        else:
+            machine.resume()
+            return success({"status": "OK"})
+    
+    @http_get
+    def is_paused(post, identifier):
+        machine = provider.find_running_machine(identifier)
+        is_paused = machine is not None and machine.is_paused()
+        return success({"isPaused": is_paused})
+        
+    def memory(post, identifier):
+        machine = provider.find_running_machine(identifier)
+        if machine is None:
+            return not_found(None)
+        else:
+            return success({"memorySize": machine.current_memory_size()})
+    
+    def set_memory(post, identifier):
+        machine = provider.find_running_machine(identifier)
+        if machine is None:
+            return not_found(None)
+        else:
+            machine.set_memory_size(post["memorySize"])
+            return success({"status": "OK"})
+        
     @http_post
     def destroy(post, identifier):
         machine = provider.find_running_machine(identifier)
@@ -99,6 +184,22 @@ def start_server(port, provider):
             machine.destroy()
         return success({"status": "OK"})
     
+    def output(request):
+        if request.method != "GET":
+            return Response(json.dumps("GET required"), status_code=405, content_type="application/json")
+        
+        machine = provider.find_running_machine(request.matchdict["identifier"])
+        if machine is None:
+            return Response(json.dumps(None), status_code=404, content_type="application/json")
+        
+        body = (request.json_body if request.body else None) or {}
+        max_bytes = body.get("maxBytes", None)
+        if body.get("follow", False):
+            app_iter = machine.follow_output(max_bytes=max_bytes)
+        else:
+            app_iter = [machine.output(max_bytes=max_bytes)]
+        return Response(app_iter=app_iter, content_type="text/plain")
+    
     @http_get
     def list_images(post):
         return success(provider.list_images())
@@ -112,6 +213,12 @@ def start_server(port, provider):
     config.add_view(machines, route_name='machines')
     config.add_route("list-images", "/images")
     config.add_view(list_images, route_name="list-images")
+    config.add_route("start-job", "/jobs")
+    config.add_view(start_job, route_name="start-job")
+    config.add_route("job", "/jobs/{identifier}")
+    config.add_view(job, route_name="job")
+    config.add_route("cancel-job", "/jobs/{identifier}/cancel")
+    config.add_view(cancel_job, route_name="cancel-job")
     
     def add_machine_route(path, view):
         name = path.replace("-", "_")
@@ -122,7 +229,13 @@ def start_server(port, provider):
     add_machine_route("", running_machine)
     add_machine_route("is-running", is_running)
     add_machine_route("restart", restart)
+    add_machine_route("power-down", power_down)
+    add_machine_route("pause", pause)
+    add_machine_route("resume", resume)
+    add_machine_route("is-paused", is_paused)
+    add_machine_route("memory", view({"GET": memory, "POST": set_memory}))
     add_machine_route("destroy", destroy)
+    add_machine_route("output", output)
     
     app = config.make_wsgi_app()
     
@@ -0,0 +1,172 @@
+import threading
+import time
+
+import spur.ssh
+
+
+# Connections to machines that have been stopped by other processes are
+# never evicted explicitly, so close connections once they're unused
+_default_idle_timeout = 5 * 60
+
+
+class ShellPool(object):
+    def __init__(self, idle_timeout=_default_idle_timeout):
+        self._lock = threading.Lock()
+        self._shells = {}
+        self._idle_timeout = idle_timeout
+    
+    def shell(self, identifier, ssh_config):
+        return PooledShell(self, _key(identifier, ssh_config), ssh_config)
+    
+    def evict(self, identifier):
+        with self._lock:
+            keys = [key for key in self._shells if key[0] == identifier]
+            shells = [self._shells.pop(key) for key in keys]
+        for shell in shells:
+            shell.close()
+    
+    def evict_idle(self):
+        now = time.time()
+        with self._lock:
+            keys = [
+                key
+                for key, shell in self._shells.iteritems()
+                if shell.is_idle(now, self._idle_timeout)
+            ]
+            shells = [self._shells.pop(key) for key in keys]
+        for shell in shells:
+            shell.close()
+    
+    def _acquire(self, key, ssh_config):
+        self.evict_idle()
+        with self._lock:
+            shell = self._shells.get(key, None)
+            if shell is not None and not _is_alive(shell):
+                del self._shells[key]
+                shell.close()
+                shell = None
+            if shell is None:
+                shell = _ConnectingShell(ssh_config.shell())
+                self._shells[key] = shell
+            return shell
+    
+    def _discard(self, key, shell):
+        with self._lock:
+            if self._shells.get(key, None) is shell:
+                del self._shells[key]
+        shell.close()
+
+
+class PooledShell(object):
+    def __init__(self, pool, key, ssh_config):
+        self._pool = pool
+        self._key = key
+        self._ssh_config = ssh_config
+    
+    def run(self, *args, **kwargs):
+        return self.spawn(*args, **kwargs).wait_for_result()
+    
+    def spawn(self, *args, **kwargs):
+        shell = self._pool._acquire(self._key, self._ssh_config)
+        was_connected = shell.is_connected()
+        try:
+            return shell.spawn(*args, **kwargs)
+        except spur.ssh.ConnectionError:
+            self._pool._discard(self._key, shell)
+            # A connection that used to work may have been dropped (for
+            # instance, by the machine restarting), so try once more with
+            # a new connection
+            if was_connected:
+                return self.spawn(*args, **kwargs)
+            else:
+                raise
+    
+    def __getattr__(self, name):
+        shell = self._pool._acquire(self._key, self._ssh_config)
+        return getattr(shell, name)
+    
+    def close(self):
+        # The connection belongs to the pool, and may be in use elsewhere
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+
+class _ConnectingShell(object):
+    def __init__(self, shell):
+        self._shell = shell
+        self._connect_lock = threading.Lock()
+        self._usage_lock = threading.Lock()
+        self._users = 0
+        self._last_used = time.time()
+    
+    def spawn(self, *args, **kwargs):
+        # spur connects lazily, so make sure that concurrent users of the
+        # same shell don't each open their own connection
+        with self._connect_lock:
+            self._shell._get_ssh_transport()
+        self._start_using()
+        try:
+            process = self._shell.spawn(*args, **kwargs)
+        except:
+            self._stop_using()
+            raise
+        return _PooledProcess(process, self._stop_using)
+    
+    def is_idle(self, now, idle_timeout):
+        # Processes that are never waited for keep the connection in use
+        with self._usage_lock:
+            return self._users == 0 and now - self._last_used >= idle_timeout
+    
+    def _start_using(self):
+        with self._usage_lock:
+            self._users += 1
+            self._last_used = time.time()
+    
+    def _stop_using(self):
+        with self._usage_lock:
+            self._users -= 1
+            self._last_used = time.time()
+    
+    def is_connected(self):
+        return self._shell._client is not None
+    
+    def __getattr__(self, name):
+        return getattr(self._shell, name)
+
+
+class _PooledProcess(object):
+    def __init__(self, process, on_finish):
+        self._process = process
+        self._on_finish = on_finish
+        self._finished = False
+    
+    def wait_for_result(self):
+        try:
+            return self._process.wait_for_result()
+        finally:
+            if not self._finished:
+                self._finished = True
+                self._on_finish()
+    
+    def __getattr__(self, name):
+        return getattr(self._process, name)
+
+
+def _is_alive(shell):
+    client = shell._client
+    if client is None:
+        return True
+    transport = client.get_transport()
+    return transport is not None and transport.is_active()
+
+
+def _key(identifier, ssh_config):
+    return (identifier, ssh_config.hostname, ssh_config.port, ssh_config.user)
+
+
+shells = ShellPool()
@@ -0,0 +1,36 @@
+import socket
+
+
+_banner_prefix = "SSH-"
+_max_banner_length = 255
+
+
+def has_ssh_banner(hostname, port, timeout=1):
+    try:
+        connection = socket.create_connection((hostname, port), timeout=timeout)
+    except socket.error:
+        return False
+    
+    try:
+        received = ""
+        while len(received) < _max_banner_length:
+            data = connection.recv(_max_banner_length - len(received))
+            if not data:
+                return False
+            received += data
+            if _has_banner_line(received):
+                return True
+        return False
+    except socket.error:
+        return False
+    finally:
+        connection.close()
+
+
+def _has_banner_line(received):
+    # Servers may send other lines before the identification string
+    return any(
+        line.startswith(_banner_prefix)
+        for line in received.split("\n")
+        if len(line) >= len(_banner_prefix)
+    )
@@ -32,7 +32,7 @@ def wait_until_successful(predicate, errors, *args, **kwargs):
     return _wait(try_predicate, *args, on_error=on_error, **kwargs)
 
 
-def _wait(condition, timeout, wait_time=None, on_error=None):
+def _wait(condition, timeout, wait_time=None, on_error=None, max_wait_time=None, interrupt=None):
     start_time = time.time()
     while True:
         finished, result = condition()
@@ -41,5 +41,11 @@ def _wait(condition, timeout, wait_time=None, on_error=None):
             
         if time.time() - start_time > timeout:
             return on_error(result)
-            
-        time.sleep(wait_time)
+        
+        if interrupt is None:
+            time.sleep(wait_time)
+        else:
+            # Check the condition again as soon as the interrupt is set
+            interrupt.wait(wait_time)
+        if max_wait_time is not None:
+            wait_time = min(wait_time * 2, max_wait_time)
@@ -0,0 +1,139 @@
+import threading
+import time
+
+from nose.tools import istest, assert_equal, assert_raises
+
+from peachtree.qemu.admission import AdmissionController, AdmissionError
+
+
+@istest
+def machine_is_admitted_if_there_are_no_limits():
+    controller = AdmissionController(_FakeStatuses([_Status("a", 4096, 4)]))
+    with controller.admit("b", 4096, 4):
+        pass
+
+
+@istest
+def machine_is_admitted_if_it_fits_alongside_running_machines():
+    statuses = _FakeStatuses([_Status("a", 512, 1)])
+    controller = AdmissionController(statuses, max_memory_size=1024, max_cpus=2)
+    with controller.admit("b", 512, 1):
+        pass
+
+
+@istest
+def memory_reclaimed_by_balloon_is_available_to_other_machines():
+    statuses = _FakeStatuses([_Status("a", 1024, 1, memory_target=256)])
+    controller = AdmissionController(statuses, max_memory_size=1024, queue_timeout=0.1, poll_interval=0.05)
+    with controller.admit("b", 512, 1):
+        pass
+
+
+@istest
+def memory_returned_to_machine_by_balloon_is_admitted_if_it_fits():
+    status = _Status("a", 1024, 1, memory_target=256)
+    controller = AdmissionController(_FakeStatuses([status]), max_memory_size=1024, queue_timeout=0.1, poll_interval=0.05)
+    with controller.admit_growth(status, 1024):
+        assert_raises(AdmissionError, lambda: controller.admit("b", 512, 1).__enter__())
+
+
+@istest
+def memory_returned_to_machine_by_balloon_is_rejected_if_it_does_not_fit():
+    status = _Status("a", 1024, 1, memory_target=256)
+    statuses = _FakeStatuses([status, _Status("b", 512, 1)])
+    controller = AdmissionController(statuses, max_memory_size=1024, queue_timeout=0.1, poll_interval=0.05)
+    assert_raises(AdmissionError, lambda: controller.admit_growth(status, 1024).__enter__())
+
+
+@istest
+def machine_that_can_never_fit_is_rejected_immediately():
+    controller = AdmissionController(_FakeStatuses([]), max_memory_size=1024, queue_timeout=10)
+    start_time = time.time()
+    assert_raises(AdmissionError, lambda: controller.admit("a", 2048, 1).__enter__())
+    assert time.time() - start_time < 1
+
+
+@istest
+def machine_is_rejected_if_capacity_does_not_become_available_before_timeout():
+    statuses = _FakeStatuses([_Status("a", 512, 1)])
+    controller = AdmissionController(statuses, max_cpus=1, queue_timeout=0.2, poll_interval=0.05)
+    assert_raises(AdmissionError, lambda: controller.admit("b", 512, 1).__enter__())
+
+
+@istest
+def reservations_of_machines_being_started_count_towards_limits():
+    controller = AdmissionController(_FakeStatuses([]), max_memory_size=1024, queue_timeout=0.1, poll_interval=0.05)
+    with controller.admit("a", 768, 1):
+        assert_raises(AdmissionError, lambda: controller.admit("b", 512, 1).__enter__())
+
+
+@istest
+def reservation_is_not_counted_twice_once_status_is_written():
+    statuses = _FakeStatuses([])
+    controller = AdmissionController(statuses, max_memory_size=1024, queue_timeout=0.1, poll_interval=0.05)
+    with controller.admit("a", 512, 1):
+        statuses.add(_Status("a", 512, 1))
+        with controller.admit("b", 512, 1):
+            pass
+
+
+@istest
+def waiting_machine_is_admitted_when_another_machine_stops():
+    statuses = _FakeStatuses([_Status("a", 1024, 1)])
+    controller = AdmissionController(statuses, max_memory_size=1024, queue_timeout=5, poll_interval=0.05)
+    
+    def stop_machine():
+        time.sleep(0.1)
+        statuses.remove("a")
+    
+    thread = threading.Thread(target=stop_machine)
+    thread.start()
+    try:
+        with controller.admit("b", 1024, 1):
+            assert_equal([], [status.identifier for status in statuses.read_running()])
+    finally:
+        thread.join()
+
+
+@istest
+def waiting_machine_is_admitted_when_another_reservation_is_released():
+    controller = AdmissionController(_FakeStatuses([]), max_cpus=1, queue_timeout=5)
+    admitted = []
+    
+    with controller.admit("a", 512, 1):
+        def start_machine():
+            with controller.admit("b", 512, 1):
+                admitted.append("b")
+        
+        thread = threading.Thread(target=start_machine)
+        thread.start()
+        time.sleep(0.1)
+        assert_equal([], admitted)
+    
+    thread.join(1)
+    assert_equal(["b"], admitted)
+
+
+class _FakeStatuses(object):
+    def __init__(self, statuses):
+        self._statuses = list(statuses)
+    
+    def add(self, status):
+        self._statuses.append(status)
+    
+    def remove(self, identifier):
+        self._statuses = [
+            status for status in self._statuses
+            if status.identifier != identifier
+        ]
+    
+    def read_running(self):
+        return list(self._statuses)
+
+
+class _Status(object):
+    def __init__(self, identifier, memory_size, cpus, memory_target=None):
+        self.identifier = identifier
+        self.memory_size = memory_size
+        self.cpus = cpus
+        self.memory_target = memory_target
@@ -0,0 +1,60 @@
+from nose.tools import istest, assert_equal
+
+from peachtree.qemu.provider import BridgeNetwork
+from peachtree.qemu.images import Image
+from peachtree.qemu.ports import PortAllocator
+from peachtree.request import request_machine
+from .tempdir import create_temporary_dir
+
+
+@istest
+def machines_are_connected_to_bridge_through_helper():
+    network = BridgeNetwork("ptbr0", vhost=False, bridge_helper="/usr/lib/qemu/qemu-bridge-helper")
+    settings = _settings_for(network)
+    assert settings.has_extra_devices()
+    assert_equal(
+        "tap,helper=/usr/lib/qemu/qemu-bridge-helper --br=ptbr0,vhost=off,id=guest-net-tap",
+        _netdevs(settings)[1],
+    )
+
+
+@istest
+def vhost_can_be_enabled():
+    network = BridgeNetwork("ptbr0", vhost=True, bridge_helper="qemu-bridge-helper")
+    settings = _settings_for(network)
+    assert_equal(
+        "tap,helper=qemu-bridge-helper --br=ptbr0,vhost=on,id=guest-net-tap",
+        _netdevs(settings)[1],
+    )
+
+
+def _settings_for(network):
+    with create_temporary_dir() as temp_dir:
+        ports = PortAllocator(temp_dir)
+        return network.settings_for(_image(), request_machine("machine", "image"), ports)
+
+
+def _netdevs(settings):
+    args = settings.qemu_args()
+    return [
+        args[index + 1]
+        for index, arg in enumerate(args)
+        if arg == "-netdev"
+    ]
+
+
+def _image():
+    return Image(
+        name="image",
+        disks=[],
+        memory_size=512,
+        cpus=1,
+        cpu_model=None,
+        disk_options=None,
+        users=[],
+        operating_system_family="linux",
+        ssh_internal_port=22,
+        resume_snapshot=None,
+        readiness_channel=None,
+        memory_balloon=False,
+    )
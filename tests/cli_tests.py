@@ -78,6 +78,23 @@ class CliApi(object):
     def destroy(self, identifier):
         self._run(["stop", identifier])
     
+    def restart(self, identifier):
+        self._run(["restart", identifier])
+    
+    def power_down(self, identifier):
+        self._run(["power-down", identifier])
+    
+    def pause(self, identifier, extend_timeout):
+        extend_timeout_args = ["--extend-timeout"] if extend_timeout else []
+        self._run(["pause", identifier] + extend_timeout_args)
+    
+    def resume(self, identifier):
+        self._run(["resume", identifier])
+    
+    def is_paused(self, identifier):
+        result = self._run(["is-paused", identifier])
+        return json.loads(result.output)
+    
     def list_images(self):
         result = self._run(["list-images"])
         return json.loads(result.output)
@@ -0,0 +1,50 @@
+from nose.tools import istest, assert_equal, assert_raises
+
+from peachtree.qemu import drives
+
+
+@istest
+def disks_use_qemu_defaults_if_no_options_are_set():
+    options = drives.disk_options(None)
+    assert_equal(
+        ["-drive", "file=/disk.qcow2,if=virtio"],
+        drives.qemu_args(["/disk.qcow2"], options),
+    )
+
+
+@istest
+def later_options_override_earlier_options():
+    options = drives.disk_options({"cache": "writeback", "discard": True}, {"cache": "unsafe"})
+    assert_equal(
+        ["-drive", "file=/disk.qcow2,if=virtio,cache=unsafe,discard=unmap"],
+        drives.qemu_args(["/disk.qcow2"], options),
+    )
+
+
+@istest
+def each_disk_has_its_own_iothread_if_enabled():
+    options = drives.disk_options({"iothread": True, "aio": "io_uring"})
+    assert_equal(
+        [
+            "-object", "iothread,id=iothread0",
+            "-drive", "file=/a.qcow2,if=none,id=disk0,aio=io_uring",
+            "-device", "virtio-blk-pci,drive=disk0,iothread=iothread0",
+            "-object", "iothread,id=iothread1",
+            "-drive", "file=/b.qcow2,if=none,id=disk1,aio=io_uring",
+            "-device", "virtio-blk-pci,drive=disk1,iothread=iothread1",
+        ],
+        drives.qemu_args(["/a.qcow2", "/b.qcow2"], options),
+    )
+
+
+@istest
+def unknown_options_are_rejected():
+    assert_raises(ValueError, lambda: drives.disk_options({"speed": "fast"}))
+    assert_raises(ValueError, lambda: drives.disk_options({"cache": "sometimes"}))
+    assert_raises(ValueError, lambda: drives.disk_options({"aio": "carrier-pigeon"}))
+
+
+@istest
+def native_aio_requires_direct_cache_mode():
+    assert_raises(ValueError, lambda: drives.disk_options({"aio": "native"}))
+    assert_equal("native", drives.disk_options({"aio": "native", "cache": "none"})["aio"])
@@ -1,4 +1,5 @@
 import time
+import threading
 
 from nose.tools import istest, assert_equal, assert_raises
 
@@ -46,3 +47,58 @@ def raise_error(value):
 @istest
 def error_is_raised_if_mapping_function_raises_error():
     assert_raises(KurtError, lambda: futures.thread_map(raise_error, [0]))
+
+
+@istest
+def thread_map_runs_at_most_max_workers_at_once():
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+    
+    def track(value):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return value
+    
+    result = futures.thread_map(track, range(6), max_workers=2)
+    assert_equal(range(6), result)
+    assert_equal(2, max_running[0])
+
+
+@istest
+def remaining_values_are_not_started_after_error():
+    started = []
+    
+    def fail_first(value):
+        started.append(value)
+        if value == 0:
+            raise KurtError("No, Javier, No!")
+        return value
+    
+    assert_raises(
+        KurtError,
+        lambda: futures.thread_map(fail_first, range(5), max_workers=1)
+    )
+    assert_equal([0], started)
+
+
+@istest
+def error_is_raised_if_value_takes_longer_than_timeout():
+    assert_raises(
+        futures.TaskTimeoutError,
+        lambda: futures.thread_map(time.sleep, [0, 1], timeout=0.05)
+    )
+
+
+@istest
+def as_completed_yields_results_in_order_of_completion():
+    def waiting_identity(value):
+        time.sleep(value)
+        return value
+    
+    result = list(futures.as_completed(waiting_identity, [0.1, 0.05, 0]))
+    assert_equal([(2, 0), (1, 0.05), (0, 0.1)], result)
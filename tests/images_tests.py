@@ -0,0 +1,115 @@
+import os
+import json
+
+from nose.tools import istest, assert_equal
+
+from peachtree.qemu.images import Images, write_resume_snapshot_config
+from .tempdir import create_temporary_dir
+
+
+@istest
+def image_is_read_from_description():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"], "memory": 1024})
+        image = Images(data_dir).image("trusty")
+        assert_equal("trusty", image.name)
+        assert_equal(1024, image.memory_size)
+        assert_equal([os.path.join(data_dir, "images", "trusty", "disk.qcow2")], image.disks)
+
+
+@istest
+def image_has_one_vcpu_with_default_cpu_model_unless_set_in_description():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"]})
+        _write_description(data_dir, "xenial", {"disks": ["disk.qcow2"], "cpus": 4, "cpuModel": "host"})
+        images = Images(data_dir)
+        assert_equal((1, None), (images.image("trusty").cpus, images.image("trusty").cpu_model))
+        assert_equal((4, "host"), (images.image("xenial").cpus, images.image("xenial").cpu_model))
+
+
+@istest
+def memory_balloon_is_disabled_unless_set_in_description():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"]})
+        _write_description(data_dir, "xenial", {"disks": ["disk.qcow2"], "memoryBalloon": True})
+        images = Images(data_dir)
+        assert_equal(False, images.image("trusty").memory_balloon)
+        assert_equal(True, images.image("xenial").memory_balloon)
+
+
+@istest
+def image_is_not_read_again_if_description_is_unchanged():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"]})
+        images = Images(data_dir)
+        assert images.image("trusty") is images.image("trusty")
+
+
+@istest
+def image_is_read_again_if_description_has_changed():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"], "memory": 1024})
+        images = Images(data_dir)
+        images.image("trusty")
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"], "memory": 2048})
+        assert_equal(2048, images.image("trusty").memory_size)
+
+
+@istest
+def image_is_read_again_after_resume_snapshot_is_set():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"]})
+        images = Images(data_dir)
+        assert_equal(None, images.image("trusty").resume_snapshot)
+        
+        snapshot_path = _build_resume_snapshot(images, "trusty")
+        images.set_resume_snapshot("trusty", snapshot_path)
+        
+        assert_equal(os.path.join(snapshot_path, "state"), images.image("trusty").resume_snapshot.state_path)
+
+
+@istest
+def resume_snapshot_is_ignored_once_its_state_has_been_removed():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"]})
+        images = Images(data_dir)
+        snapshot_path = _build_resume_snapshot(images, "trusty")
+        images.set_resume_snapshot("trusty", snapshot_path)
+        assert images.image("trusty").resume_snapshot is not None
+        
+        os.remove(os.path.join(snapshot_path, "state"))
+        assert_equal(None, images.image("trusty").resume_snapshot)
+
+
+@istest
+def resume_snapshot_is_ignored_if_image_has_changed_since_snapshot_was_built():
+    with create_temporary_dir() as data_dir:
+        _write_description(data_dir, "trusty", {"disks": ["disk.qcow2"], "memory": 1024})
+        images = Images(data_dir)
+        snapshot_path = _build_resume_snapshot(images, "trusty")
+        images.set_resume_snapshot("trusty", snapshot_path)
+        
+        _write_description(data_dir, "trusty", {
+            "disks": ["disk.qcow2"],
+            "memory": 2048,
+            "resumeSnapshot": os.path.relpath(snapshot_path, images.image_path("trusty")),
+        })
+        assert_equal(None, images.image("trusty").resume_snapshot)
+
+
+def _build_resume_snapshot(images, image_name):
+    snapshot_path = images.new_resume_snapshot_path(image_name)
+    os.makedirs(snapshot_path)
+    open(os.path.join(snapshot_path, "state"), "w").close()
+    write_resume_snapshot_config(snapshot_path, images.image(image_name))
+    return snapshot_path
+
+
+def _write_description(data_dir, name, description):
+    image_dir = os.path.join(data_dir, "images", name)
+    if not os.path.exists(image_dir):
+        os.makedirs(image_dir)
+    description_path = os.path.join(image_dir, "image.json")
+    with open(description_path + ".tmp", "w") as description_file:
+        json.dump(description, description_file)
+    os.rename(description_path + ".tmp", description_path)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from nose.tools import istest, assert_equal
+
+from peachtree import wait
+from peachtree.jobs import Jobs, JobStates
+
+
+@istest
+def result_of_job_is_available_once_job_has_finished():
+    jobs = Jobs()
+    job_id = jobs.start(lambda: 42)
+    job = jobs.wait(job_id, timeout=5)
+    assert_equal(JobStates.succeeded, job["state"])
+    assert_equal(42, job["result"])
+
+
+@istest
+def error_is_available_if_job_fails():
+    def fail():
+        raise RuntimeError("Out of cheese")
+    
+    jobs = Jobs()
+    job_id = jobs.start(fail)
+    job = jobs.wait(job_id, timeout=5)
+    assert_equal(JobStates.failed, job["state"])
+    assert_equal("Out of cheese", job["error"])
+    assert_equal("RuntimeError", job["errorType"])
+
+
+@istest
+def result_of_job_cancelled_while_running_is_discarded_once_job_finishes():
+    finish = threading.Event()
+    discarded = []
+    jobs = Jobs()
+    job_id = jobs.start(lambda: finish.wait() and 42, on_cancel=discarded.append)
+    assert jobs.cancel(job_id)
+    assert_equal([], discarded)
+    finish.set()
+    wait.wait_until(lambda: discarded, timeout=5, wait_time=0.01)
+    assert_equal([42], discarded)
+
+
+@istest
+def result_of_job_cancelled_after_finishing_is_discarded_once():
+    discarded = []
+    jobs = Jobs()
+    job_id = jobs.start(lambda: 42, on_cancel=discarded.append)
+    jobs.wait(job_id, timeout=5)
+    assert jobs.cancel(job_id)
+    assert jobs.cancel(job_id)
+    assert_equal([42], discarded)
+
+
+@istest
+def cancelling_unknown_job_returns_false():
+    assert not Jobs().cancel("nope")
+
+
+@istest
+def job_is_running_if_it_has_not_finished_before_wait_time_elapses():
+    finish = threading.Event()
+    jobs = Jobs()
+    job_id = jobs.start(finish.wait)
+    try:
+        start_time = time.time()
+        job = jobs.wait(job_id, timeout=0.1)
+        assert_equal(JobStates.running, job["state"])
+        assert time.time() - start_time >= 0.1
+    finally:
+        finish.set()
+
+
+@istest
+def waiting_returns_as_soon_as_job_finishes():
+    jobs = Jobs()
+    job_id = jobs.start(lambda: time.sleep(0.1))
+    start_time = time.time()
+    job = jobs.wait(job_id, timeout=10)
+    assert_equal(JobStates.succeeded, job["state"])
+    assert time.time() - start_time < 5
+
+
+@istest
+def unknown_job_is_none():
+    assert_equal(None, Jobs().wait("nope"))
+
+
+@istest
+def finished_jobs_are_removed_once_expired():
+    jobs = Jobs(expiry_time=0)
+    job_id = jobs.start(lambda: 42)
+    jobs.wait(job_id, timeout=5)
+    time.sleep(0.01)
+    jobs.start(lambda: None)
+    assert_equal(None, jobs.wait(job_id))
@@ -0,0 +1,21 @@
+from peachtree.qemu.statuses import status_from_dict
+
+
+def machine_status(identifier, **fields):
+    # Fields that aren't given take the defaults used for statuses written
+    # before those fields were added
+    status = status_from_dict({
+        "identifier": identifier,
+        "name": "machine",
+        "imageName": "image",
+        "sshInternalPort": 22,
+        "forwardedPorts": {"22": 50022},
+        "startTime": 0,
+        "timeout": None,
+        "processSetRunDir": None,
+    })
+    for name, value in fields.iteritems():
+        if not hasattr(status, name):
+            raise TypeError("MachineStatus has no field {0}".format(name))
+        setattr(status, name, value)
+    return status
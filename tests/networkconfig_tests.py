@@ -0,0 +1,44 @@
+import os
+
+from nose.tools import istest, assert_equal
+import spur
+
+from peachtree.qemu.networkconfig import NetworkConfigurer
+from .tempdir import create_temporary_dir
+
+
+@istest
+def hosts_entries_are_appended_to_hosts_file_using_single_command():
+    with create_temporary_dir() as temp_dir:
+        hosts_path = os.path.join(temp_dir, "hosts")
+        with open(hosts_path, "w") as hosts_file:
+            hosts_file.write("127.0.0.1 localhost\n")
+        
+        shell = CountingShell(spur.LocalShell())
+        configurer = NetworkConfigurer(FakeNetworkConfig(hosts_path), shell)
+        configurer.add_hosts_entries([
+            ("192.168.0.1", "first"),
+            ("192.168.0.2", "second"),
+        ])
+        
+        with open(hosts_path) as hosts_file:
+            assert_equal(
+                "127.0.0.1 localhost\n192.168.0.1 first\n192.168.0.2 second\n",
+                hosts_file.read()
+            )
+        assert_equal(1, shell.commands_run)
+
+
+class FakeNetworkConfig(object):
+    def __init__(self, hosts_path):
+        self.hosts_path = hosts_path
+
+
+class CountingShell(object):
+    def __init__(self, shell):
+        self._shell = shell
+        self.commands_run = 0
+    
+    def run(self, *args, **kwargs):
+        self.commands_run += 1
+        return self._shell.run(*args, **kwargs)
@@ -0,0 +1,114 @@
+import os
+import threading
+
+from nose.tools import istest, assert_equal
+
+from peachtree import outputlog
+from .tempdir import create_temporary_dir
+
+
+@istest
+def output_is_not_rotated_until_file_reaches_max_size():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        _write(path, "hello world")
+        outputlog.rotate(path, max_size=100)
+        assert_equal("hello world", _read(path))
+        assert not os.path.exists(outputlog.rotated_path(path))
+
+
+@istest
+def rotating_output_moves_output_to_rotated_file_and_truncates_file():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        _write(path, "0123456789abcdefghij")
+        outputlog.rotate(path, max_size=8)
+        assert_equal("0123456789abcdefghij", _read(outputlog.rotated_path(path)))
+        assert_equal("", _read(path))
+
+
+@istest
+def output_appended_after_rotation_is_written_to_start_of_file():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            os.write(fd, "0123456789")
+            outputlog.rotate(path, max_size=8)
+            os.write(fd, "abc")
+        finally:
+            os.close(fd)
+        assert_equal("abc", _read(path))
+
+
+@istest
+def tail_reads_end_of_output_across_rotated_file():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        _write(outputlog.rotated_path(path), "0123456789")
+        _write(path, "abc")
+        assert_equal("789abc", outputlog.tail(path, 6))
+        assert_equal("bc", outputlog.tail(path, 2))
+        assert_equal("0123456789abc", outputlog.tail(path, 100))
+
+
+@istest
+def tail_of_missing_output_is_empty():
+    with create_temporary_dir() as temp_dir:
+        assert_equal("", outputlog.tail(os.path.join(temp_dir, "output"), 10))
+
+
+@istest
+def follow_reads_output_until_finished():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        _write(path, "one\n")
+        finished = threading.Event()
+        followed = outputlog.follow(path, finished.is_set, poll_interval=0.01)
+        
+        assert_equal("one\n", next(followed))
+        with open(path, "a") as output_file:
+            output_file.write("two\n")
+        assert_equal("two\n", next(followed))
+        
+        finished.set()
+        assert_equal([], list(followed))
+
+
+@istest
+def follow_continues_after_output_is_rotated():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        _write(path, "one\n")
+        finished = threading.Event()
+        followed = outputlog.follow(path, finished.is_set, poll_interval=0.01)
+        assert_equal("one\n", next(followed))
+        
+        with open(path, "a") as output_file:
+            output_file.write("two\n")
+        outputlog.rotate(path, max_size=1)
+        with open(path, "a") as output_file:
+            output_file.write("three\n")
+        finished.set()
+        
+        assert_equal("two\nthree\n", "".join(followed))
+
+
+@istest
+def follow_starts_from_max_bytes_before_end_of_output():
+    with create_temporary_dir() as temp_dir:
+        path = os.path.join(temp_dir, "output")
+        _write(outputlog.rotated_path(path), "0123456789")
+        _write(path, "abc")
+        followed = outputlog.follow(path, lambda: True, max_bytes=6)
+        assert_equal("789abc", "".join(followed))
+
+
+def _read(path):
+    with open(path) as output_file:
+        return output_file.read()
+
+
+def _write(path, contents):
+    with open(path, "w") as output_file:
+        output_file.write(contents)
@@ -0,0 +1,59 @@
+from nose.tools import istest, assert_equal
+
+from peachtree.qemu.placement import CpuPlacement, parse_cpu_list, format_cpu_list
+
+
+@istest
+def cpu_list_ranges_are_expanded():
+    assert_equal([0, 1, 2, 3, 8, 10, 11], parse_cpu_list("0-3,8,10-11\n"))
+
+
+@istest
+def cpu_list_is_formatted_in_order():
+    assert_equal("1,2,5", format_cpu_list([5, 1, 2]))
+
+
+@istest
+def machine_is_placed_on_least_loaded_node():
+    statuses = _FakeStatuses([_Status("a", [0, 1])])
+    placement = CpuPlacement(statuses, topology=[(0, [0, 1, 2, 3]), (1, [4, 5, 6, 7])])
+    with placement.place("b", 2) as host_cpus:
+        assert_equal([4, 5], host_cpus)
+
+
+@istest
+def machine_is_placed_on_least_loaded_cpus_of_node():
+    statuses = _FakeStatuses([_Status("a", [0, 1])])
+    placement = CpuPlacement(statuses, topology=[(0, [0, 1, 2, 3])])
+    with placement.place("b", 2) as host_cpus:
+        assert_equal([2, 3], host_cpus)
+
+
+@istest
+def machines_being_started_are_spread_across_nodes():
+    placement = CpuPlacement(_FakeStatuses([]), topology=[(0, [0, 1]), (1, [2, 3])])
+    with placement.place("a", 1) as first_host_cpus:
+        with placement.place("b", 1) as second_host_cpus:
+            assert_equal([0], first_host_cpus)
+            assert_equal([2], second_host_cpus)
+
+
+@istest
+def machine_with_more_vcpus_than_any_node_is_spread_across_all_cpus():
+    placement = CpuPlacement(_FakeStatuses([]), topology=[(0, [0, 1]), (1, [2, 3])])
+    with placement.place("a", 6) as host_cpus:
+        assert_equal([0, 1, 2, 3, 0, 1], host_cpus)
+
+
+class _FakeStatuses(object):
+    def __init__(self, statuses):
+        self._statuses = statuses
+    
+    def read_running(self):
+        return list(self._statuses)
+
+
+class _Status(object):
+    def __init__(self, identifier, host_cpus):
+        self.identifier = identifier
+        self.host_cpus = host_cpus
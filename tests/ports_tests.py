@@ -0,0 +1,86 @@
+import os
+import socket
+import time
+
+from nose.tools import istest, assert_equal, assert_raises
+
+from peachtree.qemu.ports import PortAllocator, PortAllocationError
+from .tempdir import create_temporary_dir
+
+
+@istest
+def leased_ports_are_within_range_and_distinct():
+    with create_temporary_dir() as temp_dir:
+        ports = PortAllocator(temp_dir, port_range=(40000, 40010))
+        leased = ports.lease("tcp", 5)
+        assert_equal(5, len(set(leased)))
+        assert all(40000 <= port < 40010 for port in leased)
+
+
+@istest
+def leased_port_is_not_leased_again_by_another_allocator():
+    with create_temporary_dir() as temp_dir:
+        first_leased = PortAllocator(temp_dir, port_range=(40000, 40002)).lease("tcp", 1)
+        second_leased = PortAllocator(temp_dir, port_range=(40000, 40002)).lease("tcp", 1)
+        assert_equal([40000, 40001], sorted(first_leased + second_leased))
+
+
+@istest
+def released_port_can_be_leased_again():
+    with create_temporary_dir() as temp_dir:
+        ports = PortAllocator(temp_dir, port_range=(40000, 40001))
+        leased = ports.lease("tcp", 1)
+        ports.release("tcp", leased)
+        assert_equal(leased, ports.lease("tcp", 1))
+
+
+@istest
+def ports_are_leased_separately_for_each_protocol():
+    with create_temporary_dir() as temp_dir:
+        ports = PortAllocator(temp_dir, port_range=(40000, 40001))
+        assert_equal([40000], ports.lease("tcp", 1))
+        assert_equal([40000], ports.lease("udp", 1))
+
+
+@istest
+def ports_in_use_by_other_processes_are_not_leased():
+    with create_temporary_dir() as temp_dir:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            listener.bind(("", 0))
+            port = listener.getsockname()[1]
+            ports = PortAllocator(temp_dir, port_range=(port, port + 1))
+            assert_raises(PortAllocationError, lambda: ports.lease("tcp", 1))
+            assert_equal([], os.listdir(temp_dir))
+        finally:
+            listener.close()
+
+
+@istest
+def partial_lease_is_released_if_not_enough_ports_are_available():
+    with create_temporary_dir() as temp_dir:
+        ports = PortAllocator(temp_dir, port_range=(40000, 40002))
+        assert_raises(PortAllocationError, lambda: ports.lease("tcp", 3))
+        assert_equal(2, len(ports.lease("tcp", 2)))
+
+
+@istest
+def clean_releases_old_leases_that_no_status_refers_to():
+    with create_temporary_dir() as temp_dir:
+        ports = PortAllocator(temp_dir, port_range=(40000, 40003), grace_period=60)
+        leased = ports.lease("tcp", 3)
+        old_time = time.time() - 120
+        for port in leased[:2]:
+            os.utime(os.path.join(temp_dir, "tcp-{0}".format(port)), (old_time, old_time))
+        
+        ports.clean([_Status({"tcp": [leased[0]], "udp": []})])
+        
+        assert_equal(
+            sorted(["tcp-{0}".format(leased[0]), "tcp-{0}".format(leased[2])]),
+            sorted(os.listdir(temp_dir)),
+        )
+
+
+class _Status(object):
+    def __init__(self, leased_ports):
+        self.leased_ports = leased_ports
@@ -4,6 +4,7 @@ import os
 
 from nose.tools import istest, nottest, assert_equal, assert_raises
 import spur
+import psutil
 
 from peachtree import processes, wait
 from .tempdir import create_temporary_dir
@@ -138,3 +139,143 @@ def additional_processes_can_be_started_and_restored_from_run_dir(start):
 def error_is_raised_if_trying_to_start_process_with_duplicate_name(start):
     process_set = start({"true": ["true"]})
     assert_raises(ValueError, lambda: process_set.start({"true": ["true"]}))
+
+
+@test
+def can_detect_which_process_sets_are_running(start):
+    running_process_set = start({
+        "sleep": ["sh", "-c", "sleep 1"],
+    })
+    partly_running_process_set = start({
+        "sleep": ["sh", "-c", "sleep 1"],
+        "true": ["true"],
+    })
+    wait.wait_until_not(partly_running_process_set.all_running, timeout=1, wait_time=0.1)
+    
+    assert_equal(
+        [True, False],
+        processes.all_running_each([running_process_set, partly_running_process_set])
+    )
+    running_process_set.kill_all()
+    partly_running_process_set.kill_all()
+
+
+@test
+def process_with_same_pid_but_different_start_time_is_not_running(start):
+    process_set = start({
+        "sleep": ["sh", "-c", "sleep 1"],
+    })
+    try:
+        process_info, = process_set.process_infos()
+        other_process_info = processes.ProcessInfo(process_info.pid, process_info.start_time - 1)
+        assert processes._process_is_running(process_info)
+        assert not processes._process_is_running(other_process_info)
+    finally:
+        process_set.kill_all()
+
+
+@test
+def wait_for_exit_returns_once_processes_have_exited(start):
+    process_set = start({
+        "sleep": ["sh", "-c", "sleep 0.1"],
+    })
+    assert process_set.wait_for_exit(timeout=1)
+    assert not process_set.any_running()
+
+
+@test
+def wait_for_exit_returns_false_if_processes_are_still_running(start):
+    process_set = start({
+        "sleep": ["sh", "-c", "sleep 1"],
+    })
+    try:
+        assert not process_set.wait_for_exit(timeout=0.1)
+    finally:
+        process_set.kill_all()
+
+
+@test
+def exit_event_is_set_when_any_process_exits(start):
+    process_set = start({
+        "sleep": ["sh", "-c", "sleep 1"],
+        "true": ["true"],
+    })
+    try:
+        assert process_set.exit_event().wait(1)
+    finally:
+        process_set.kill_all()
+
+
+@test
+def exits_of_processes_that_have_already_exited_are_done(start):
+    process_set = start({
+        "true": ["true"],
+    })
+    wait.wait_until_not(process_set.any_running, timeout=1, wait_time=0.1)
+    assert all(process_exit.has_exited() for process_exit in process_set.exits())
+
+
+@test
+def supervisor_falls_back_to_polling_if_pidfds_are_unavailable(start):
+    process_set = start({
+        "sleep": ["sh", "-c", "sleep 0.1"],
+    })
+    libc = processes._libc
+    processes._libc = None
+    try:
+        supervisor = processes.Supervisor()
+        process_exits = [
+            supervisor.watch(process_info)
+            for process_info in process_set.process_infos()
+        ]
+        assert all(process_exit.wait(1) for process_exit in process_exits)
+    finally:
+        processes._libc = libc
+
+
+@test
+def kill_all_escalates_to_sigkill_if_process_ignores_sigterm(start):
+    process_set = start({
+        "stubborn": ["sh", "-c", "trap '' TERM; echo trapped; while true; do sleep 0.1; done"],
+    })
+    wait.wait_until(lambda: "trapped" in process_set.all_output(), timeout=1, wait_time=0.05)
+    
+    process_set.kill_all(grace_period=0.2)
+    assert not process_set.any_running()
+
+
+@test
+def processes_are_spawned_without_a_shell(start):
+    process_set = start({
+        "sleep": ["sleep", "1"],
+    })
+    try:
+        process_info, = process_set.process_infos()
+        assert_equal(["sleep", "1"], psutil.Process(process_info.pid).cmdline)
+    finally:
+        process_set.kill_all()
+
+
+@istest
+def output_of_process_is_rotated_once_it_reaches_max_size():
+    with create_temporary_dir() as temp_dir:
+        process_set = processes.start(
+            {"seq": ["seq", "1000"]},
+            os.path.join(temp_dir, "run"),
+        )
+        wait.wait_until_not(process_set.all_running, timeout=1, wait_time=0.1)
+        process_set.rotate_output(max_size=100)
+        
+        output_path = os.path.join(process_set.run_dir, "seq.output")
+        assert_equal(0, os.path.getsize(output_path))
+        assert process_set.output("seq").endswith("999\n1000\n")
+
+
+@test
+def tail_of_output_can_be_read(start):
+    process_set = start({
+        "echo": ["sh", "-c", "echo one; echo two"]
+    })
+    wait.wait_until_not(process_set.all_running, timeout=1, wait_time=0.1)
+    assert_equal("two\n", process_set.output("echo", max_bytes=4))
+    assert_equal("echo:\n    two\n", process_set.all_output(max_bytes=4))
@@ -115,6 +115,27 @@ def can_restart_machine(provider):
         assert_equals(1, result.return_code)
 
 
+@test
+def paused_machine_is_still_running_and_can_be_resumed(provider):
+    with provider.start(_IMAGE_NAME) as machine:
+        machine.pause()
+        assert machine.is_paused()
+        assert machine.is_running()
+        
+        machine.resume()
+        assert not machine.is_paused()
+        result = machine.shell().run(["echo", "Hello there"])
+        assert_equals("Hello there\n", result.output)
+
+
+@test
+def powering_down_machine_stops_it(provider):
+    with provider.start(_IMAGE_NAME) as machine:
+        machine.power_down()
+        
+        assert not machine.is_running()
+
+
 
 @test
 def list_of_machines_is_empty_if_none_are_running(provider):
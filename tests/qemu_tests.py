@@ -1,4 +1,5 @@
 import os
+import json
 import contextlib
 
 from nose.tools import istest, assert_equal
@@ -18,28 +19,48 @@ _WINDOWS_IMAGE_NAME="windows-server-2012-x86-64"
 
 
 @contextlib.contextmanager
-def provider_with_temp_data_dir(networking):
+def provider_with_temp_data_dir(networking, copied_images=(), **kwargs):
     with create_temporary_dir() as data_dir:
         def _pick_image(name):
             image_path = peachtree.qemu.Images().image_path(name)
             temp_image_path = peachtree.qemu.Images(data_dir).image_path(name)
             if not os.path.exists(os.path.dirname(temp_image_path)):
                 os.makedirs(os.path.dirname(temp_image_path))
-            os.symlink(image_path, temp_image_path)    
+            if name in copied_images:
+                _copy_image_description(name, temp_image_path)
+            else:
+                os.symlink(image_path, temp_image_path)    
         
         _pick_image(_IMAGE_NAME)
         _pick_image(_WINDOWS_IMAGE_NAME)
         
-        provider = peachtree.qemu_provider(networking=networking, data_dir=data_dir)
+        provider = peachtree.qemu_provider(
+            networking=networking,
+            data_dir=data_dir,
+            **kwargs
+        )
         try:
             yield provider
         finally:
+            provider.drain_warm_pools()
             for machine in provider.list_running_machines():
                 machine.destroy()
 
 
-def provider_with_user_networking():
-    return provider_with_temp_data_dir(peachtree.qemu.UserNetworking())
+def _copy_image_description(name, temp_image_path):
+    images = peachtree.qemu.Images()
+    with open(os.path.join(images.image_path(name), "image.json")) as description_file:
+        description = json.load(description_file)
+    description["disks"] = images.image(name).disks
+    description.pop("resumeSnapshot", None)
+    
+    os.makedirs(temp_image_path)
+    with open(os.path.join(temp_image_path, "image.json"), "w") as description_file:
+        json.dump(description, description_file)
+
+
+def provider_with_user_networking(**kwargs):
+    return provider_with_temp_data_dir(peachtree.qemu.UserNetworking(), **kwargs)
     
 
 QemuProviderTests = provider_tests.create(
@@ -87,3 +108,49 @@ def cron_does_not_kill_machines_without_timeout():
         with provider.start(_IMAGE_NAME) as machine:
             provider.cron()
             assert machine.is_running()
+
+
+@istest
+def machines_in_warm_pool_are_not_listed_until_claimed():
+    warm_pools = {_IMAGE_NAME: peachtree.qemu.pool_size(1)}
+    with provider_with_user_networking(warm_pools=warm_pools) as provider:
+        provider.cron()
+        assert_equal([], provider.list_running_machines())
+        with provider.start(_IMAGE_NAME) as machine:
+            running_machines = provider.list_running_machines()
+            assert_equal(
+                [machine.identifier],
+                [running.identifier for running in running_machines]
+            )
+            result = machine.shell().run(["echo", "Hello there"])
+            assert_equal("Hello there\n", result.output)
+
+
+@istest
+def machines_can_be_restored_from_resume_snapshot():
+    with provider_with_user_networking(copied_images=[_IMAGE_NAME]) as provider:
+        provider.build_resume_snapshot(_IMAGE_NAME)
+        with provider.start(_IMAGE_NAME) as machine:
+            result = machine.shell().run(["echo", "Hello there"])
+            assert_equal("Hello there\n", result.output)
+
+
+@istest
+def host_directories_can_be_shared_with_machines():
+    with create_temporary_dir() as host_path:
+        with open(os.path.join(host_path, "greeting"), "w") as greeting_file:
+            greeting_file.write("Hello there")
+        with provider_with_user_networking() as provider:
+            shared_directories = [(host_path, "/mnt/shared")]
+            with provider.start(_IMAGE_NAME, shared_directories=shared_directories) as machine:
+                result = machine.shell().run(["cat", "/mnt/shared/greeting"])
+                assert_equal("Hello there", result.output)
+
+
+@istest
+def disk_overlays_are_removed_from_overlay_dir_when_machine_is_stopped():
+    with create_temporary_dir() as overlay_dir:
+        with provider_with_user_networking(overlay_dir=overlay_dir) as provider:
+            with provider.start(_IMAGE_NAME) as machine:
+                assert_equal([machine.identifier], os.listdir(overlay_dir))
+            assert_equal([], os.listdir(overlay_dir))
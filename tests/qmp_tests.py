@@ -0,0 +1,110 @@
+import os
+import socket
+import threading
+import contextlib
+import json
+
+from nose.tools import istest, assert_equals, assert_raises
+
+from peachtree.qemu import qmp
+from .tempdir import create_temporary_dir
+
+
+@istest
+def client_negotiates_capabilities_before_executing_commands():
+    received = []
+    
+    def monitor(connection, read_command):
+        connection.sendall('{"QMP": {}}\n')
+        received.append(read_command()["execute"])
+        connection.sendall('{"return": {}}\n')
+        received.append(read_command()["execute"])
+        connection.sendall('{"return": {"status": "running", "running": true}}\n')
+    
+    with _monitor_socket(monitor) as socket_path:
+        with qmp.connect(socket_path, timeout=1) as client:
+            status = client.execute("query-status")
+    
+    assert_equals(["qmp_capabilities", "query-status"], received)
+    assert_equals("running", status["status"])
+
+
+@istest
+def events_are_skipped_while_waiting_for_response():
+    def monitor(connection, read_command):
+        connection.sendall('{"QMP": {}}\n')
+        read_command()
+        connection.sendall('{"return": {}}\n')
+        read_command()
+        connection.sendall('{"event": "RESET"}\n{"return": {}}\n')
+    
+    with _monitor_socket(monitor) as socket_path:
+        with qmp.connect(socket_path, timeout=1) as client:
+            assert_equals({}, client.execute("system_reset"))
+
+
+@istest
+def error_response_raises_qmp_error():
+    def monitor(connection, read_command):
+        connection.sendall('{"QMP": {}}\n')
+        read_command()
+        connection.sendall('{"return": {}}\n')
+        read_command()
+        connection.sendall('{"error": {"class": "CommandNotFound", "desc": "The command nope has not been found"}}\n')
+    
+    with _monitor_socket(monitor) as socket_path:
+        with qmp.connect(socket_path, timeout=1) as client:
+            assert_raises(qmp.QmpError, lambda: client.execute("nope"))
+
+
+@istest
+def unresponsive_monitor_raises_socket_error_after_timeout():
+    def monitor(connection, read_command):
+        connection.recv(1)
+    
+    with _monitor_socket(monitor) as socket_path:
+        client = qmp.QmpClient(socket_path, timeout=0.1)
+        assert_raises(socket.error, client.connect)
+        client.close()
+
+
+@istest
+def connection_is_closed_if_connecting_fails():
+    closed = threading.Event()
+    
+    def monitor(connection, read_command):
+        # Reading returns nothing once the client has closed the connection
+        if connection.recv(1) == "":
+            closed.set()
+    
+    with _monitor_socket(monitor) as socket_path:
+        client = qmp.QmpClient(socket_path, timeout=0.1)
+        assert_raises(socket.error, client.connect)
+        closed.wait(1)
+        assert closed.is_set()
+
+
+@contextlib.contextmanager
+def _monitor_socket(monitor):
+    with create_temporary_dir() as temp_dir:
+        socket_path = os.path.join(temp_dir, "qmp.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+        
+        def serve():
+            connection, address = server.accept()
+            connection_file = connection.makefile()
+            try:
+                monitor(connection, lambda: json.loads(connection_file.readline()))
+            finally:
+                connection_file.close()
+                connection.close()
+        
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield socket_path
+        finally:
+            server.close()
@@ -0,0 +1,86 @@
+import os
+import socket
+import threading
+import contextlib
+import json
+
+from nose.tools import istest, assert_raises
+
+from peachtree.qemu import readiness
+from .tempdir import create_temporary_dir
+
+
+@istest
+def virtio_serial_channel_is_ready_when_guest_writes_ready_line():
+    def guest(connection):
+        connection.sendall("booting\nREADY\n")
+        connection.recv(1)
+    
+    with _guest_socket(guest) as socket_path:
+        readiness.wait_until_ready(
+            readiness.readiness_channel("virtio-serial"),
+            socket_path,
+            timeout=1,
+            check_process=lambda: None,
+        )
+
+
+@istest
+def guest_agent_channel_is_ready_when_guest_agent_responds_to_ping():
+    def guest(connection):
+        request = json.loads(connection.makefile().readline())
+        if request["execute"] == "guest-ping":
+            connection.sendall('{"return": {}}\n')
+        connection.recv(1)
+    
+    with _guest_socket(guest) as socket_path:
+        readiness.wait_until_ready(
+            readiness.readiness_channel("guest-agent"),
+            socket_path,
+            timeout=1,
+            check_process=lambda: None,
+        )
+
+
+@istest
+def error_is_raised_if_guest_does_not_signal_readiness_before_timeout():
+    def guest(connection):
+        connection.recv(1)
+    
+    with _guest_socket(guest) as socket_path:
+        assert_raises(RuntimeError, lambda: readiness.wait_until_ready(
+            readiness.readiness_channel("virtio-serial"),
+            socket_path,
+            timeout=0.1,
+            check_process=lambda: None,
+            idle_time=0.05,
+        ))
+
+
+@istest
+def error_is_raised_for_unknown_readiness_channel():
+    assert_raises(ValueError, lambda: readiness.readiness_channel("carrier-pigeon"))
+
+
+@contextlib.contextmanager
+def _guest_socket(guest):
+    with create_temporary_dir() as temp_dir:
+        socket_path = os.path.join(temp_dir, "readiness.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+        
+        def serve():
+            connection, address = server.accept()
+            try:
+                guest(connection)
+            finally:
+                connection.close()
+        
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield socket_path
+        finally:
+            server.close()
@@ -0,0 +1,14 @@
+from nose.tools import istest, assert_equal
+
+from peachtree.request import request_from_dict, request_machine
+
+
+@istest
+def fields_missing_from_request_dict_have_default_values():
+    request = request_from_dict({
+        "name": "machine",
+        "imageName": "image",
+        "publicPorts": [22],
+        "timeout": 60,
+    })
+    assert_equal(request_machine("machine", "image", public_ports=[22], timeout=60), request)
@@ -0,0 +1,143 @@
+import os
+import stat
+
+from nose.tools import istest, assert_equal, assert_raises
+
+from peachtree.qemu import shareddirectories
+from peachtree.qemu.shareddirectories import SharedDirectory, NinePBackend, shared_directory_config
+from .tempdir import create_temporary_dir
+
+
+@istest
+def each_shared_directory_is_given_its_own_tag_and_socket():
+    with create_temporary_dir() as host_path:
+        directories = shareddirectories.shared_directories(
+            [(host_path, "/mnt/a"), (host_path, "/mnt/b")],
+            lambda tag: "/run/{0}.sock".format(tag),
+        )
+        assert_equal(
+            [
+                SharedDirectory(host_path=host_path, guest_path="/mnt/a", tag="peachtree0", socket_path="/run/peachtree0.sock"),
+                SharedDirectory(host_path=host_path, guest_path="/mnt/b", tag="peachtree1", socket_path="/run/peachtree1.sock"),
+            ],
+            directories,
+        )
+
+
+@istest
+def host_path_of_shared_directory_must_exist():
+    with create_temporary_dir() as host_path:
+        assert_raises(
+            ValueError,
+            lambda: shareddirectories.shared_directories([(host_path + "/missing", "/mnt")], _socket_path),
+        )
+
+
+@istest
+def guest_path_of_shared_directory_must_be_absolute():
+    with create_temporary_dir() as host_path:
+        assert_raises(
+            ValueError,
+            lambda: shareddirectories.shared_directories([(host_path, "mnt")], _socket_path),
+        )
+
+
+@istest
+def ninep_backend_exports_each_directory_with_virtfs():
+    directory = _directory("/srv/src", "/mnt/src", "peachtree0")
+    assert_equal(
+        ["-virtfs", "local,path=/srv/src,mount_tag=peachtree0,security_model=none,id=peachtree0"],
+        NinePBackend().start(None, [directory], 512),
+    )
+
+
+@istest
+def commas_in_paths_are_escaped():
+    directory = _directory("/srv/a,b", "/mnt/src", "peachtree0")
+    assert_equal(
+        ["-virtfs", "local,path=/srv/a,,b,mount_tag=peachtree0,security_model=none,id=peachtree0"],
+        NinePBackend().start(None, [directory], 512),
+    )
+
+
+@istest
+def virtiofsd_is_not_looked_for_until_directories_are_shared():
+    looked_for = []
+    
+    def create_backend():
+        looked_for.append(True)
+        return NinePBackend()
+    
+    backend = shareddirectories._LazyBackend(create_backend)
+    assert_equal([], backend.start(None, [], 512))
+    assert_equal([], looked_for)
+    assert_equal("9p", backend.mount_type)
+    assert_equal([True], looked_for)
+
+
+@istest
+def unknown_shared_directory_backend_is_rejected():
+    assert_raises(ValueError, lambda: shareddirectories.shared_directory_backend("nfs"))
+
+
+@istest
+def virtiofsd_shipped_with_qemu_is_not_used():
+    with create_temporary_dir() as temp_dir:
+        current_path = _script(temp_dir, "current", "Usage: virtiofsd [OPTIONS] --shared-dir <SHARED_DIR>")
+        old_path = _script(temp_dir, "old", "usage: virtiofsd [options]\n    -o source=PATH")
+        assert shareddirectories._is_supported_virtiofsd(current_path)
+        assert not shareddirectories._is_supported_virtiofsd(old_path)
+
+
+@istest
+def shared_directories_are_mounted_by_tag_on_linux():
+    shell = _FakeShell()
+    config = shared_directory_config("linux", shell)
+    config.mount([_directory("/srv/src", "/mnt/src", "peachtree0")], "virtiofs")
+    assert_equal(
+        [
+            ["mkdir", "-p", "/mnt/src"],
+            ["mount", "-t", "virtiofs", "peachtree0", "/mnt/src"],
+        ],
+        shell.commands,
+    )
+
+
+@istest
+def ninep_mounts_use_virtio_transport():
+    shell = _FakeShell()
+    config = shared_directory_config("linux", shell)
+    config.mount([_directory("/srv/src", "/mnt/src", "peachtree0")], "9p")
+    assert_equal(
+        ["mount", "-t", "9p", "-o", "trans=virtio,version=9p2000.L,msize=262144", "peachtree0", "/mnt/src"],
+        shell.commands[-1],
+    )
+
+
+@istest
+def shared_directories_are_not_supported_on_windows():
+    assert_raises(ValueError, lambda: shared_directory_config("windows", _FakeShell()))
+
+
+def _directory(host_path, guest_path, tag):
+    return SharedDirectory(host_path=host_path, guest_path=guest_path, tag=tag, socket_path=_socket_path(tag))
+
+
+def _script(directory, name, help_text):
+    path = os.path.join(directory, name)
+    with open(path, "w") as script_file:
+        script_file.write("#!/bin/sh\necho '{0}'\n".format(help_text))
+    os.chmod(path, stat.S_IRWXU)
+    return path
+
+
+def _socket_path(tag):
+    return "/run/{0}.sock".format(tag)
+
+
+class _FakeShell(object):
+    def __init__(self):
+        self.commands = []
+    
+    def run(self, command):
+        self.commands.append(command)
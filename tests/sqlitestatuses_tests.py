@@ -0,0 +1,113 @@
+import os
+import threading
+import contextlib
+
+from nose.tools import istest, assert_equal
+
+from peachtree import processes
+from peachtree.qemu.sqlitestatuses import SqliteStatuses
+from .tempdir import create_temporary_dir
+from .machinestatuses import machine_status
+
+
+@istest
+def written_status_can_be_read():
+    with _statuses() as statuses:
+        status = machine_status("a")
+        statuses.write(status)
+        assert_equal(status, statuses.read("a"))
+        assert_equal([status], statuses.read_all())
+
+
+@istest
+def writing_status_again_replaces_status():
+    with _statuses() as statuses:
+        statuses.write(machine_status("a", name="first"))
+        statuses.write(machine_status("a", name="second"))
+        assert_equal(["second"], [status.name for status in statuses.read_all()])
+
+
+@istest
+def removed_status_is_not_read():
+    with _statuses() as statuses:
+        statuses.write(machine_status("a"))
+        statuses.remove("a")
+        assert_equal(None, statuses.read("a"))
+        assert_equal([], statuses.read_all())
+
+
+@istest
+def statuses_can_be_read_by_image():
+    with _statuses() as statuses:
+        statuses.write(machine_status("a", image_name="one"))
+        statuses.write(machine_status("b", image_name="two"))
+        assert_equal(["a"], _identifiers(statuses.read_by_image("one")))
+
+
+@istest
+def expired_statuses_are_read_by_expiry_time():
+    with _statuses() as statuses:
+        statuses.write(machine_status("a", start_time=100, timeout=10))
+        statuses.write(machine_status("b", start_time=100, timeout=30))
+        statuses.write(machine_status("c", start_time=100, timeout=None))
+        assert_equal(["a"], _identifiers(statuses.read_expired(120)))
+
+
+@istest
+def status_can_only_be_claimed_once():
+    with _statuses() as statuses:
+        statuses.write(machine_status("a"))
+        assert not statuses.is_claimed("a")
+        assert statuses.claim("a")
+        assert not statuses.claim("a")
+        assert statuses.is_claimed("a")
+
+
+@istest
+def claim_is_kept_when_status_is_written_again():
+    with _statuses() as statuses:
+        statuses.write(machine_status("a"))
+        statuses.claim("a")
+        statuses.write(machine_status("a", name="claimed"))
+        assert statuses.is_claimed("a")
+
+
+@istest
+def status_written_in_another_thread_can_be_read():
+    with _statuses() as statuses:
+        thread = threading.Thread(target=lambda: statuses.write(machine_status("a")))
+        thread.start()
+        thread.join()
+        assert_equal(["a"], _identifiers(statuses.read_all()))
+
+
+@istest
+def process_set_can_be_restored_from_database():
+    with _statuses() as statuses:
+        storage_dir = statuses.process_storage_dir("a")
+        original_process_set = processes.start(
+            {"sleep": ["sh", "-c", "sleep 1"]},
+            storage_dir,
+            run_directory=statuses.run_directory,
+        )
+        assert not os.path.exists(os.path.join(storage_dir, "names"))
+        
+        process_set = processes.from_dir(
+            original_process_set.run_dir,
+            run_directory=statuses.run_directory,
+        )
+        assert process_set.all_running()
+        process_set.kill_all()
+
+
+@contextlib.contextmanager
+def _statuses():
+    with create_temporary_dir() as temp_dir:
+        yield SqliteStatuses(
+            os.path.join(temp_dir, "status.sqlite"),
+            os.path.join(temp_dir, "status"),
+        )
+
+
+def _identifiers(statuses):
+    return sorted(status.identifier for status in statuses)
@@ -0,0 +1,144 @@
+from nose.tools import istest, assert_equal, assert_raises
+import spur.ssh
+
+from peachtree import sshpool
+
+
+@istest
+def connection_is_reused_by_shells_for_same_machine():
+    ssh_config = FakeSshConfig()
+    pool = sshpool.ShellPool()
+    
+    with pool.shell("machine", ssh_config) as shell:
+        shell.run(["true"])
+    with pool.shell("machine", ssh_config) as shell:
+        shell.run(["true"])
+    
+    assert_equal(1, len(ssh_config.shells))
+    assert_equal(2, ssh_config.shells[0].commands_run)
+
+
+@istest
+def evicting_machine_closes_its_connections():
+    ssh_config = FakeSshConfig()
+    pool = sshpool.ShellPool()
+    
+    pool.shell("machine", ssh_config).run(["true"])
+    pool.evict("machine")
+    pool.shell("machine", ssh_config).run(["true"])
+    
+    assert_equal(2, len(ssh_config.shells))
+    assert ssh_config.shells[0].closed
+
+
+@istest
+def dead_connection_is_replaced():
+    ssh_config = FakeSshConfig()
+    pool = sshpool.ShellPool()
+    
+    pool.shell("machine", ssh_config).run(["true"])
+    ssh_config.shells[0].transport.active = False
+    pool.shell("machine", ssh_config).run(["true"])
+    
+    assert_equal(2, len(ssh_config.shells))
+
+
+@istest
+def command_is_retried_once_if_previously_working_connection_fails():
+    ssh_config = FakeSshConfig()
+    pool = sshpool.ShellPool()
+    
+    pool.shell("machine", ssh_config).run(["true"])
+    ssh_config.shells[0].broken = True
+    pool.shell("machine", ssh_config).run(["true"])
+    
+    assert_equal(2, len(ssh_config.shells))
+    assert_equal(1, ssh_config.shells[1].commands_run)
+
+
+@istest
+def connection_error_on_first_connection_is_raised():
+    ssh_config = FakeSshConfig(broken=True)
+    pool = sshpool.ShellPool()
+    
+    shell = pool.shell("machine", ssh_config)
+    assert_raises(spur.ssh.ConnectionError, lambda: shell.run(["true"]))
+    assert_equal(1, len(ssh_config.shells))
+
+
+@istest
+def idle_connections_are_closed():
+    ssh_config = FakeSshConfig()
+    pool = sshpool.ShellPool(idle_timeout=0)
+    
+    pool.shell("machine", ssh_config).run(["true"])
+    pool.evict_idle()
+    
+    assert ssh_config.shells[0].closed
+
+
+@istest
+def connections_are_not_idle_while_process_is_running():
+    ssh_config = FakeSshConfig()
+    pool = sshpool.ShellPool(idle_timeout=0)
+    
+    process = pool.shell("machine", ssh_config).spawn(["true"])
+    pool.evict_idle()
+    assert not ssh_config.shells[0].closed
+    
+    process.wait_for_result()
+    pool.evict_idle()
+    assert ssh_config.shells[0].closed
+
+
+class FakeSshConfig(object):
+    hostname = "localhost"
+    port = 2222
+    user = "qemu-user"
+    
+    def __init__(self, broken=False):
+        self.shells = []
+        self._broken = broken
+    
+    def shell(self):
+        shell = FakeShell(self._broken)
+        self.shells.append(shell)
+        return shell
+
+
+class FakeShell(object):
+    def __init__(self, broken):
+        self._client = None
+        self.transport = FakeTransport()
+        self.broken = broken
+        self.closed = False
+        self.commands_run = 0
+    
+    def _get_ssh_transport(self):
+        if self.broken:
+            raise spur.ssh.ConnectionError("Broken")
+        self._client = self
+        return self.transport
+    
+    def get_transport(self):
+        return self.transport
+    
+    def spawn(self, command):
+        self._get_ssh_transport()
+        self.commands_run += 1
+        return FakeProcess()
+    
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport(object):
+    active = True
+    
+    def is_active(self):
+        return self.active
+
+
+class FakeProcess(object):
+    def wait_for_result(self):
+        return None
@@ -0,0 +1,59 @@
+import socket
+import threading
+import contextlib
+
+from nose.tools import istest
+
+from peachtree import sshready
+
+
+@istest
+def ssh_banner_is_available_if_server_sends_identification_string():
+    with _server(["SSH-2.0-OpenSSH_5.9\r\n"]) as port:
+        assert sshready.has_ssh_banner("localhost", port)
+
+
+@istest
+def ssh_banner_is_available_if_identification_string_is_sent_in_pieces():
+    with _server(["SS", "H-2.0-OpenSSH_5.9\r\n"]) as port:
+        assert sshready.has_ssh_banner("localhost", port)
+
+
+@istest
+def ssh_banner_is_available_if_other_lines_are_sent_first():
+    with _server(["Welcome\r\nSSH-2.0-OpenSSH_5.9\r\n"]) as port:
+        assert sshready.has_ssh_banner("localhost", port)
+
+
+@istest
+def ssh_banner_is_not_available_if_server_closes_connection():
+    with _server([]) as port:
+        assert not sshready.has_ssh_banner("localhost", port)
+
+
+@istest
+def ssh_banner_is_not_available_if_nothing_is_listening():
+    with _server([]) as port:
+        pass
+    assert not sshready.has_ssh_banner("localhost", port)
+
+
+@contextlib.contextmanager
+def _server(chunks):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("localhost", 0))
+    server.listen(1)
+    
+    def serve():
+        connection, address = server.accept()
+        for chunk in chunks:
+            connection.sendall(chunk)
+        connection.close()
+    
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server.getsockname()[1]
+    finally:
+        server.close()
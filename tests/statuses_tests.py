@@ -0,0 +1,180 @@
+import os
+import json
+
+from nose.tools import istest, assert_equal
+
+from peachtree import processes, wait
+from peachtree.qemu.statuses import Statuses
+from .tempdir import create_temporary_dir
+from .machinestatuses import machine_status
+
+
+@istest
+def written_status_can_be_read():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        status = machine_status("a")
+        statuses.write(status)
+        assert_equal(status, statuses.read("a"))
+        assert_equal([status], statuses.read_all())
+
+
+@istest
+def removed_status_is_not_read():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        statuses.write(machine_status("a"))
+        statuses.remove("a")
+        assert_equal(None, statuses.read("a"))
+        assert_equal([], statuses.read_all())
+
+
+@istest
+def statuses_can_be_read_by_image():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        statuses.write(machine_status("a", image_name="one"))
+        statuses.write(machine_status("b", image_name="two"))
+        statuses.write(machine_status("c", image_name="one"))
+        statuses.write(machine_status("c", image_name="two"))
+        
+        assert_equal(["a"], _identifiers(statuses.read_by_image("one")))
+        assert_equal(["b", "c"], _identifiers(statuses.read_by_image("two")))
+
+
+@istest
+def statuses_of_machines_running_for_longer_than_their_timeout_have_expired():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        statuses.write(machine_status("a", start_time=100, timeout=10))
+        statuses.write(machine_status("b", start_time=100, timeout=30))
+        statuses.write(machine_status("c", start_time=100, timeout=None))
+        assert_equal(["a"], _identifiers(statuses.read_expired(120)))
+
+
+@istest
+def paused_time_counts_toward_timeout_unless_pause_extends_timeout():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        statuses.write(machine_status("a", start_time=100, timeout=10, paused_time=105))
+        statuses.write(machine_status("b", start_time=100, timeout=10, paused_time=105, pause_extends_timeout=True))
+        statuses.write(machine_status("c", start_time=100, timeout=10, timeout_extension=15))
+        assert_equal(["a"], _identifiers(statuses.read_expired(120)))
+
+
+@istest
+def statuses_written_by_other_instances_are_read():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        other_statuses = Statuses(temp_dir)
+        statuses.write(machine_status("a", name="first"))
+        assert_equal("first", other_statuses.read("a").name)
+        
+        statuses.write(machine_status("a", name="second"))
+        statuses.write(machine_status("b"))
+        assert_equal("second", other_statuses.read("a").name)
+        assert_equal(["a", "b"], _identifiers(other_statuses.read_all()))
+        
+        statuses.remove("a")
+        assert_equal(["b"], _identifiers(other_statuses.read_all()))
+
+
+@istest
+def statuses_are_read_from_cache_if_status_dir_is_unchanged():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        Statuses(temp_dir).write(machine_status("a", name="first"))
+        _set_mtime_to_past(temp_dir)
+        assert_equal("first", statuses.read("a").name)
+        
+        status_path = os.path.join(temp_dir, "a", "status.json")
+        with open(status_path) as status_file:
+            status_json = json.load(status_file)
+        status_json["name"] = "second"
+        with open(status_path, "w") as status_file:
+            json.dump(status_json, status_file)
+        
+        assert_equal("first", statuses.read("a").name)
+
+
+@istest
+def modifying_read_status_does_not_modify_stored_status():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(temp_dir)
+        statuses.write(machine_status("a", name="first"))
+        statuses.read("a").name = "second"
+        assert_equal("first", statuses.read("a").name)
+
+
+@istest
+def no_statuses_are_read_if_status_dir_does_not_exist():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(os.path.join(temp_dir, "status"))
+        assert_equal([], statuses.read_all())
+        assert_equal(None, statuses.read("a"))
+
+
+@istest
+def status_written_without_later_fields_is_read_with_defaults():
+    with create_temporary_dir() as temp_dir:
+        os.mkdir(os.path.join(temp_dir, "a"))
+        with open(os.path.join(temp_dir, "a", "status.json"), "w") as status_file:
+            json.dump({
+                "identifier": "a",
+                "name": "machine",
+                "imageName": "image",
+                "sshInternalPort": 22,
+                "forwardedPorts": {"22": 50022},
+                "startTime": 0,
+                "timeout": None,
+                "processSetRunDir": None,
+            }, status_file)
+        
+        status = Statuses(temp_dir).read("a")
+        assert_equal({22: 50022}, status.forwarded_ports)
+        assert_equal({"tcp": [50022], "udp": []}, status.leased_ports)
+        assert_equal((512, 1), (status.memory_size, status.cpus))
+        assert_equal((None, None, 0), (status.pool_state, status.memory_target, status.timeout_extension))
+
+
+@istest
+def socket_paths_are_within_unix_socket_path_limit():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(os.path.join(temp_dir, "x" * 100))
+        path = statuses.socket_path("a", "readiness")
+        assert len(path) <= 107
+        assert not os.path.exists(os.path.dirname(path))
+        
+        statuses.create_socket_dir("a")
+        try:
+            assert os.path.isdir(os.path.dirname(path))
+            assert_equal(0700, os.stat(os.path.dirname(os.path.dirname(path))).st_mode & 0777)
+        finally:
+            statuses.remove_sockets("a")
+        assert not os.path.exists(os.path.dirname(path))
+        assert_equal(path, statuses.socket_path("a", "readiness"))
+        assert not os.path.exists(os.path.dirname(path))
+
+
+@istest
+def statuses_of_machines_whose_processes_have_exited_are_not_read_as_running():
+    with create_temporary_dir() as temp_dir:
+        statuses = Statuses(os.path.join(temp_dir, "status"))
+        running_set = processes.start({"sleep": ["sleep", "10"]}, os.path.join(temp_dir, "running"))
+        try:
+            exited_set = processes.start({"true": ["true"]}, os.path.join(temp_dir, "exited"))
+            wait.wait_until_not(exited_set.any_running, timeout=1, wait_time=0.1)
+            statuses.write(machine_status("a", process_set_run_dir=running_set.run_dir))
+            statuses.write(machine_status("b", process_set_run_dir=exited_set.run_dir))
+            assert_equal(["a"], _identifiers(statuses.read_running()))
+        finally:
+            running_set.kill_all()
+
+
+def _set_mtime_to_past(path):
+    past = os.stat(path).st_mtime - 60
+    os.utime(path, (past, past))
+
+
+def _identifiers(statuses):
+    return sorted(status.identifier for status in statuses)
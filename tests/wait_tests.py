@@ -0,0 +1,41 @@
+import time
+
+from nose.tools import istest, assert_equal
+
+from peachtree import wait
+
+
+@istest
+def wait_until_returns_first_truthy_result_of_predicate():
+    results = iter([None, 0, "done"])
+    result = wait.wait_until(lambda: next(results), timeout=1, wait_time=0)
+    assert_equal("done", result)
+
+
+@istest
+def wait_until_raises_error_with_message_if_timeout_expires():
+    try:
+        wait.wait_until(lambda: False, timeout=0, wait_time=0, error_message="Nope")
+        assert False, "Expected error"
+    except RuntimeError as error:
+        assert_equal("Nope", str(error))
+
+
+@istest
+def wait_time_is_doubled_after_each_attempt_up_to_max_wait_time():
+    attempt_times = []
+    
+    def predicate():
+        attempt_times.append(time.time())
+        return len(attempt_times) == 5
+    
+    wait.wait_until(predicate, timeout=1, wait_time=0.01, max_wait_time=0.04)
+    
+    intervals = [
+        attempt_times[index + 1] - attempt_times[index]
+        for index in range(len(attempt_times) - 1)
+    ]
+    expected_intervals = [0.01, 0.02, 0.04, 0.04]
+    for interval, expected_interval in zip(intervals, expected_intervals):
+        assert interval >= expected_interval
+    assert intervals[-1] < 0.08